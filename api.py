@@ -0,0 +1,202 @@
+import hashlib
+from datetime import datetime, timedelta
+
+from flask import Blueprint, abort, current_app, jsonify, request
+
+import bookings
+from autocomplete import autocomplete
+import geo
+import queries
+from model import Venue
+
+# ----------------------------------------------------------------------------#
+# JSON API.
+# ----------------------------------------------------------------------------#
+# Read-only JSON views of the listing and detail pages, built from the same
+# (cached) data as the HTML pages. Every response carries a strong ETag and a
+# Last-Modified derived from the version of the rows it was built from;
+# requests carrying the current ETag are answered with 304 before the
+# payload is built.
+# The version is also part of the cache key of the payload, so that a worker
+# cannot send a payload it cached before another worker's write under the
+# ETag of the new version.
+# The free/busy and nearby views are answered directly and are not cached;
+# autocomplete is answered from an in-memory index.
+
+API_VERSION = 'v1'
+
+api = Blueprint('api', __name__, url_prefix='/api/' + API_VERSION)
+
+
+def conditional(version, key, build):
+    if version is None:
+        abort(404)
+    etag = hashlib.sha1(repr((API_VERSION, key, version)).encode()).hexdigest()
+    # Timestamps of versions are in UTC.
+    timestamps = [value for value in version if isinstance(value, datetime)]
+    last_modified = max(timestamps).replace(microsecond=0) if timestamps else None
+
+    # Only the ETag covers the whole version: a row deleted from a listing,
+    # or a show moving to the past, changes no timestamp. If-Modified-Since
+    # is not evaluated, and Last-Modified is informational.
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+
+@api.route('/venues')
+def venues():
+    cursor = request.args.get('after')
+    version = queries.venue_areas_version(cursor)
+    def build():
+        data = queries.venue_areas(cursor, version)
+        return {'areas': data['areas'], 'next_cursor': data['next_cursor']}
+    return conditional(version, ('venues', cursor), build)
+
+
+def float_arg(name, low, high):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except ValueError:
+        abort(400)
+    if not low <= value <= high:
+        abort(400)
+    return value
+
+
+@api.route('/venues/nearby')
+def venues_nearby():
+    latitude, longitude = float_arg('lat', -90, 90), float_arg('lng', -180, 180)
+    if latitude is None or longitude is None:
+        # Around the centre of a known city instead of a point.
+        location = geo.locate(request.args.get('city', ''),
+                              request.args.get('state', ''))
+        if location is None:
+            abort(400)
+        latitude, longitude = location
+    radius_km = float_arg('radius_km', 0, 20000)
+    limit = request.args.get('limit', 20, type=int)
+    if not 1 <= limit <= current_app.config['NEARBY_MAX_RESULTS']:
+        abort(400)
+
+    rows = geo.nearby(latitude, longitude, limit, radius_km)
+    return jsonify({
+        'latitude': latitude,
+        'longitude': longitude,
+        'venues': [{
+            'id': row.id,
+            'name': row.name,
+            'address': row.address,
+            'city': row.city,
+            'state': row.state,
+            'latitude': row.latitude,
+            'longitude': row.longitude,
+            'distance_km': round(row.distance_km, 3),
+            'num_upcoming_shows': row.num_upcoming_shows
+        } for row in rows]
+    })
+
+
+@api.route('/venues/<int:venue_id>')
+def venue(venue_id):
+    past_before = request.args.get('past_before')
+    version = queries.venue_version(venue_id)
+    return conditional(version, ('venue', venue_id, past_before),
+                       lambda: queries.venue_detail(venue_id, past_before,
+                                                    version))
+
+
+@api.route('/artists')
+def artists():
+    cursor = request.args.get('after')
+    version = queries.artist_list_version(cursor)
+    return conditional(version, ('artists', cursor),
+                       lambda: queries.artist_list(cursor, version))
+
+
+@api.route('/artists/<int:artist_id>')
+def artist(artist_id):
+    past_before = request.args.get('past_before')
+    version = queries.artist_version(artist_id)
+    return conditional(version, ('artist', artist_id, past_before),
+                       lambda: queries.artist_detail(artist_id, past_before,
+                                                     version))
+
+
+@api.route('/shows')
+def shows():
+    cursor = request.args.get('after')
+    version = queries.show_list_version(cursor)
+    return conditional(version, ('shows', cursor),
+                       lambda: queries.show_list(cursor, version))
+
+
+@api.route('/autocomplete')
+def autocomplete_names():
+    kind = request.args.get('type', 'venue')
+    if kind not in autocomplete.MODELS:
+        abort(400)
+    limit = request.args.get('limit', current_app.config['AUTOCOMPLETE_LIMIT'],
+                             type=int)
+    if not 1 <= limit <= current_app.config['AUTOCOMPLETE_MAX_LIMIT']:
+        abort(400)
+    prefix = request.args.get('q', '')
+    return jsonify({
+        'type': kind,
+        'q': prefix,
+        'results': autocomplete.search(kind, prefix, limit)
+    })
+
+
+def calendar_window():
+    try:
+        start = datetime.fromisoformat(request.args['start']) \
+            if request.args.get('start') else datetime.now().replace(
+                hour=0, minute=0, second=0, microsecond=0)
+        end = datetime.fromisoformat(request.args['end']) \
+            if request.args.get('end') else start + timedelta(days=7)
+    except ValueError:
+        abort(400)
+    max_days = current_app.config['CALENDAR_MAX_WINDOW_DAYS']
+    if not start < end <= start + timedelta(days=max_days):
+        abort(400)
+    return start, end
+
+
+@api.route('/venues/<int:venue_id>/availability')
+def venue_availability(venue_id):
+    start, end = calendar_window()
+    data = bookings.free_busy(Venue.query.filter(Venue.id == venue_id),
+                              start, end)
+    if not data['venues']:
+        abort(404)
+    return jsonify(data['venues'][0])
+
+
+@api.route('/availability')
+def availability():
+    city, state = request.args.get('city'), request.args.get('state')
+    if not city or not state:
+        abort(400)
+    start, end = calendar_window()
+    venues = Venue.query.filter(Venue.city == city, Venue.state == state)
+    return jsonify(bookings.free_busy(venues, start, end,
+                                      cursor=request.args.get('after')))
+
+
+@api.errorhandler(400)
+def bad_request_error(error):
+    return jsonify(error='bad request'), 400
+
+
+@api.errorhandler(404)
+def not_found_error(error):
+    return jsonify(error='not found'), 404
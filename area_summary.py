@@ -0,0 +1,121 @@
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import DateTime, Integer, String, column, table, text
+
+from cache import cache
+from model import db
+
+# ----------------------------------------------------------------------------#
+# Venue area summary.
+# ----------------------------------------------------------------------------#
+# /venues reads the per-venue upcoming show counts from the materialized view
+# venue_area_summary instead of aggregating Show on every request. The view
+# is refreshed CONCURRENTLY (readers are never blocked):
+#   - AREA_SUMMARY_DEBOUNCE_SECONDS after a write, coalescing bursts of writes
+#     into one refresh;
+#   - when the earliest upcoming show in the view starts, so it moves to the
+#     past on time;
+#   - at the latest every AREA_SUMMARY_REFRESH_SECONDS.
+# A transaction-level advisory lock keeps workers from refreshing at the same
+# time; a worker that finds the lock taken tries again after the debounce.
+
+VIEW_NAME = 'venue_area_summary'
+
+venue_area_summary = table(
+    VIEW_NAME,
+    column('venue_id', Integer),
+    column('city', String),
+    column('state', String),
+    column('name', String),
+    column('num_upcoming_shows', Integer),
+    column('next_show', DateTime),
+)
+
+materialized_view_refresh = table(
+    'materialized_view_refresh',
+    column('view_name', String),
+    column('refreshed_at', DateTime),
+)
+
+
+def refresh():
+    """Refresh the view now. Returns False if another process holds the lock."""
+    with db.engine.begin() as connection:
+        locked = connection.execute(
+            text('SELECT pg_try_advisory_xact_lock(hashtext(:name))'),
+            name=VIEW_NAME).scalar()
+        if not locked:
+            return False
+        connection.execute('REFRESH MATERIALIZED VIEW CONCURRENTLY %s' % VIEW_NAME)
+        connection.execute(materialized_view_refresh.update()
+                           .where(materialized_view_refresh.c.view_name == VIEW_NAME)
+                           .values(refreshed_at=db.func.now()))
+    cache.invalidate('venues')
+    return True
+
+
+def next_transition():
+    return db.session.query(db.func.min(venue_area_summary.c.next_show)).scalar()
+
+
+class AreaSummaryRefresher(object):
+
+    def __init__(self, app=None):
+        self.app = None
+        self.lock = threading.Lock()
+        self.timer = None
+        self.due = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        # Timers are threads, so they are started in the serving process on
+        # its first request rather than at import (CLI, migrations, fork).
+        app.before_first_request(self.start)
+        app.extensions['area_summary'] = self
+
+    def start(self):
+        self.schedule(self.app.config['AREA_SUMMARY_REFRESH_SECONDS'])
+
+    def schedule(self, delay):
+        with self.lock:
+            due = time.monotonic() + delay
+            if self.timer is not None and self.due <= due:
+                return
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = threading.Timer(delay, self.run)
+            self.timer.daemon = True
+            self.due = due
+            self.timer.start()
+
+    def request_refresh(self):
+        if self.app is not None:
+            self.schedule(self.app.config['AREA_SUMMARY_DEBOUNCE_SECONDS'])
+
+    def run(self):
+        with self.lock:
+            self.timer = self.due = None
+        config = self.app.config
+        delay = config['AREA_SUMMARY_REFRESH_SECONDS']
+        with self.app.app_context():
+            try:
+                if refresh():
+                    upcoming = next_transition()
+                    if upcoming is not None:
+                        until = (upcoming - datetime.now()).total_seconds()
+                        delay = min(delay, max(until, config['AREA_SUMMARY_DEBOUNCE_SECONDS']))
+                else:
+                    delay = config['AREA_SUMMARY_DEBOUNCE_SECONDS']
+            except Exception:
+                current_app.logger.exception('Refreshing %s failed', VIEW_NAME)
+            finally:
+                db.session.remove()
+        self.schedule(delay)
+
+
+refresher = AreaSummaryRefresher()
@@ -0,0 +1,157 @@
+import sys
+
+from flask import (Blueprint, abort, current_app, flash, redirect,
+                   render_template, request, url_for)
+
+import queries
+import search
+from export import export_response
+from forms import ArtistForm
+from model import db, Artist
+from recommendations import recommender
+from replicas import read_only, use_primary
+
+# ----------------------------------------------------------------------------#
+# Artists.
+# ----------------------------------------------------------------------------#
+
+artists = Blueprint('artists', __name__, url_prefix='/artists')
+
+EXPORT_FIELDS = ['id', 'name', 'city', 'state', 'phone', 'genres',
+                 'image_link', 'facebook_link', 'website_link',
+                 'seeking_venue', 'seeking_description']
+
+
+@artists.route('')
+def index():
+    data = queries.artist_list(request.args.get('after'))
+    return render_template('pages/artists.html', artists=data['artists'],
+                           next_cursor=data['next_cursor'])
+
+@artists.route('/search', methods=['POST'])
+@read_only
+def search_artists():
+    search_text = request.form['search_term']
+    artists = search.search_artists(search_text)
+    response = {
+        "count": len(artists),
+        "data": artists
+    }
+    return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+
+@artists.route('/<int:artist_id>')
+def show_artist(artist_id):
+    data = queries.artist_detail(artist_id,
+                                 past_before=request.args.get('past_before'))
+    if not data:
+        abort(404)
+    recommendations = recommender.recommend(
+        'artist', data, current_app.config['RECOMMENDATIONS_LIMIT'])
+    return render_template('pages/show_artist.html', artist=data,
+                           recommendations=recommendations)
+
+#  Update
+#  ----------------------------------------------------------------
+
+@artists.route('/<int:artist_id>/edit', methods=['GET'])
+@use_primary
+def edit_artist(artist_id):
+    artist = Artist.query.get(artist_id)
+    if not artist:
+        abort(404)
+    form = ArtistForm(obj=artist)
+    return render_template('forms/edit_artist.html', form=form, artist=artist)
+
+@artists.route('/<int:artist_id>/edit', methods=['POST'])
+def edit_artist_submission(artist_id):
+    artist = Artist.query.get(artist_id)
+    if not artist:
+        abort(404)
+
+    form = ArtistForm(request.form, meta={'csrf': False})
+    error = False
+
+    try:
+        artist.name = form.name.data
+        artist.city = form.city.data
+        artist.state = form.state.data
+        artist.phone = form.phone.data
+        artist.facebook_link = form.facebook_link.data
+        artist.website_link = form.website_link.data
+        artist.seeking_venue = form.seeking_venue.data
+        artist.genres = form.genres.data
+        artist.image_link = form.image_link.data
+        artist.seeking_description = form.seeking_description.data
+        db.session.commit()
+        queries.artist_changed(artist_id)
+    except:
+        error = True
+        print(sys.exc_info())
+        db.session.rollback()
+    finally:
+        db.session.close()
+
+    if error:
+        abort(500)
+
+    return redirect(url_for('artists.show_artist', artist_id=artist_id))
+
+#  Create Artist
+#  ----------------------------------------------------------------
+
+@artists.route('/create', methods=['GET'])
+def create_artist_form():
+  form = ArtistForm()
+  return render_template('forms/new_artist.html', form=form)
+
+@artists.route('/create', methods=['POST'])
+def create_artist_submission():
+    form = ArtistForm(request.form, meta={'csrf': False})
+
+    if form.validate():
+        error = False
+        try:
+            artist = Artist(name=form.name.data,
+                            city=form.city.data,
+                            state=form.state.data,
+                            phone=form.phone.data,
+                            image_link=form.image_link.data,
+                            facebook_link=form.facebook_link.data,
+                            website_link=form.website_link.data,
+                            seeking_venue=form.seeking_venue.data,
+                            genres=form.genres.data,
+                            seeking_description=form.seeking_description.data)
+            db.session.add(artist)
+            db.session.commit()
+            queries.artist_changed(artist.id)
+        except:
+            print(sys.exc_info())
+            error = True
+            db.session.rollback()
+        finally:
+            db.session.close()
+
+        if error:
+            flash('An error occurred. Artist ' +
+                form.name.data + ' could not be listed.')
+        else:
+            flash('Artist ' + form.name.data + ' was successfully listed!')
+        return render_template('pages/home.html')
+    else:
+        message = []
+        for field, errors in form.errors.items():
+            for error in errors:
+                message.append(f"{field}: {error}")
+        flash('Please fix all the following errors: ' + ', '.join(message))
+        form = ArtistForm()
+        return render_template('forms/new_artist.html', form=form)
+
+#  Export
+#  ----------------------------------------------------------------
+
+@artists.route('/export.<any(csv, ndjson):fmt>')
+def export_artists(fmt):
+    query = Artist.query.with_entities(
+        *[getattr(Artist, field) for field in EXPORT_FIELDS])\
+        .order_by(Artist.id)
+    return export_response(query, EXPORT_FIELDS, fmt, 'artists')
@@ -0,0 +1,189 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+
+import click
+from flask import abort, current_app, request, send_file
+from flask.cli import AppGroup
+
+# ----------------------------------------------------------------------------#
+# Static assets.
+# ----------------------------------------------------------------------------#
+# `flask assets build` copies static/ to ASSETS_BUILD_DIR with the content
+# hash in every file name (css/main.css -> css/main.1a2b3c4d5e6f.css), along
+# with gzip and brotli versions of the text assets, and writes a manifest of
+# the renamed files. brotli is only imported by the build. url_for('static')
+# then returns the hashed names, and the static view serves them with a
+# one-year immutable Cache-Control, picking the precompressed file from
+# Accept-Encoding: a browser fetches each version of an asset once, and the
+# workers compress nothing at request time.
+#
+# url() references in stylesheets are rewritten to the hashed names of what
+# they point at, so fonts and images are cached as well. Without a build,
+# static files are served from static/ under their own names, as before.
+
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 12
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.ttf', '.eot', '.otf', '.json',
+                '.txt', '.html')
+# Encodings in order of preference, with the suffix of their files.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")?#]+)([^'")]*)\1\s*\)''')
+
+
+class Assets(object):
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.hashed = set()
+        self.build_dir = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.build_dir = app.config['ASSETS_BUILD_DIR']
+        self.manifest = load_manifest(self.build_dir)
+        self.hashed = set(self.manifest.values())
+        app.url_defaults(self.hashed_url)
+        app.view_functions['static'] = self.serve
+        app.extensions['assets'] = self
+
+    def hashed_url(self, endpoint, values):
+        if endpoint == 'static':
+            filename = values.get('filename')
+            values['filename'] = self.manifest.get(filename, filename)
+
+    def serve(self, filename):
+        filename = posixpath.normpath(filename)
+        if filename not in self.hashed:
+            return current_app.send_static_file(filename)
+
+        path = os.path.join(self.build_dir, *filename.split('/'))
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        accepted = request.accept_encodings
+        for encoding, suffix in ENCODINGS:
+            if accepted[encoding] and os.path.exists(path + suffix):
+                response = send_file(path + suffix, mimetype=mimetype,
+                                     conditional=True,
+                                     cache_timeout=IMMUTABLE_MAX_AGE)
+                response.content_encoding = encoding
+                break
+        else:
+            if not os.path.exists(path):
+                abort(404)
+            response = send_file(path, mimetype=mimetype, conditional=True,
+                                 cache_timeout=IMMUTABLE_MAX_AGE)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+def load_manifest(build_dir):
+    try:
+        with open(os.path.join(build_dir, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def hashed_name(name, content):
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    root, ext = posixpath.splitext(name)
+    return '%s.%s%s' % (root, digest, ext)
+
+
+def rewrite_css(name, content, manifest):
+    base = posixpath.dirname(name)
+
+    def replace(match):
+        quote, target, rest = match.groups()
+        if target.startswith(('/', 'data:', 'http:', 'https:')):
+            return match.group(0)
+        resolved = posixpath.normpath(posixpath.join(base, target))
+        if resolved not in manifest:
+            return match.group(0)
+        relative = posixpath.relpath(manifest[resolved], base)
+        return 'url(%s%s%s%s)' % (quote, relative, rest, quote)
+
+    return CSS_URL.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+
+def compress(path, content):
+    """Write gzip and brotli versions of path next to it, when smaller."""
+    import brotli
+
+    written = []
+    compressed = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(compressed) < len(content):
+        with open(path + '.gz', 'wb') as f:
+            f.write(compressed)
+        written.append('gzip')
+    compressed = brotli.compress(content, quality=11)
+    if len(compressed) < len(content):
+        with open(path + '.br', 'wb') as f:
+            f.write(compressed)
+        written.append('br')
+    return written
+
+
+def build(static_dir, build_dir):
+    """Copy static_dir to build_dir under hashed names; return the manifest
+    and the number of precompressed files."""
+    names = []
+    for root, _, files in os.walk(static_dir):
+        for filename in files:
+            if filename.startswith('.'):
+                continue
+            path = os.path.relpath(os.path.join(root, filename), static_dir)
+            names.append(path.replace(os.sep, '/'))
+    # Stylesheets last, once the names of what they refer to are known.
+    names.sort(key=lambda name: (name.endswith('.css'), name))
+
+    manifest, compressed = {}, 0
+    for name in names:
+        with open(os.path.join(static_dir, *name.split('/')), 'rb') as f:
+            content = f.read()
+        if name.endswith('.css'):
+            content = rewrite_css(name, content, manifest)
+        manifest[name] = hashed_name(name, content)
+        path = os.path.join(build_dir, *manifest[name].split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        if name.endswith(COMPRESSIBLE):
+            compressed += len(compress(path, content))
+
+    # Files of earlier builds are left in place for pages rendered by workers
+    # still running them; the manifest is replaced in one step.
+    path = os.path.join(build_dir, MANIFEST)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+    return manifest, compressed
+
+
+assets_command = AppGroup('assets', help='Build the static assets.')
+
+
+@assets_command.command('build')
+def build_command():
+    """Fingerprint and precompress static/ into ASSETS_BUILD_DIR. Restart
+    the app to serve the new build."""
+    try:
+        import brotli
+    except ImportError:
+        raise click.ClickException('brotli is not installed: '
+                                   'pip install -r requirements.txt')
+    manifest, compressed = build(current_app.static_folder,
+                                 current_app.config['ASSETS_BUILD_DIR'])
+    click.echo('%d assets built, %d precompressed files'
+               % (len(manifest), compressed))
+
+
+assets = Assets()
@@ -0,0 +1,165 @@
+from array import array
+from bisect import bisect_left
+
+from indexes import BackgroundIndex
+from model import db, Artist, Venue
+
+# ----------------------------------------------------------------------------#
+# Autocomplete.
+# ----------------------------------------------------------------------------#
+# Venue and artist names are kept in memory in sorted arrays, so a typeahead
+# lookup is a bisect to the first key starting with the typed prefix followed
+# by a short forward scan: around 10 microseconds at a million names, without
+# a database round trip. Besides the whole name, each later word starts a key
+# ("rock cafe", "cafe"), so "caf" finds "Hard Rock Cafe"; names starting with
+# the prefix come first.
+#
+# Memory: a key is a str object (about 50 bytes plus its length) plus an
+# 8-byte list slot; ids are packed in arrays of 8-byte ints and the display
+# names are kept once per entity in a dict. For names of three words that is
+# about 370 bytes per name, 0.37 GB per million names, per worker process.
+# Adding or removing a name shifts the arrays: a few milliseconds at that
+# size.
+#
+# The index is built in the background (see indexes.py); until it is ready,
+# lookups return nothing. The create, edit and delete handlers update it in
+# place through queries.venue_changed and queries.artist_changed; other
+# workers pick up their changes when their index, older than
+# AUTOCOMPLETE_MAX_AGE, is rebuilt.
+
+BUILD_BATCH_SIZE = 10000
+# A lookup examines at most this many word keys per requested match.
+SCAN_FACTOR = 20
+
+
+def normalize(text):
+    return ' '.join((text or '').casefold().split())
+
+
+class SortedKeys(object):
+    """(key, id) pairs in key order, as a list of keys and an array of ids."""
+
+    def __init__(self, pairs=()):
+        pairs = sorted(pairs)
+        self.keys = [key for key, _ in pairs]
+        self.ids = array('q', (id for _, id in pairs))
+
+    def insert(self, key, id):
+        position = bisect_left(self.keys, key)
+        while position < len(self.keys) and self.keys[position] == key \
+                and self.ids[position] < id:
+            position += 1
+        self.keys.insert(position, key)
+        self.ids.insert(position, id)
+
+    def delete(self, key, id):
+        position = bisect_left(self.keys, key)
+        while position < len(self.keys) and self.keys[position] == key:
+            if self.ids[position] == id:
+                del self.keys[position]
+                del self.ids[position]
+                return
+            position += 1
+
+    def scan(self, prefix, count):
+        """Ids of the first `count` keys starting with prefix."""
+        position = bisect_left(self.keys, prefix)
+        end = min(len(self.keys), position + count)
+        while position < end and self.keys[position].startswith(prefix):
+            yield self.ids[position]
+            position += 1
+
+
+class PrefixIndex(object):
+    """Names of one kind of entity, keyed by the whole name and by the tail of
+    the name starting at each later word."""
+
+    def __init__(self, rows=()):
+        self.names = {}
+        whole, tails = [], []
+        for id, name in rows:
+            self.names[id] = name
+            keys = self.name_keys(name)
+            whole.append((keys[0], id))
+            tails.extend((key, id) for key in keys[1:])
+        self.whole = SortedKeys(whole)
+        self.tails = SortedKeys(tails)
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def name_keys(name):
+        words = normalize(name).split(' ')
+        return [' '.join(words[index:]) for index in range(len(words))]
+
+    def add(self, id, name):
+        self.names[id] = name
+        keys = self.name_keys(name)
+        self.whole.insert(keys[0], id)
+        for key in keys[1:]:
+            self.tails.insert(key, id)
+
+    def remove(self, id):
+        name = self.names.pop(id, None)
+        if name is None:
+            return
+        keys = self.name_keys(name)
+        self.whole.delete(keys[0], id)
+        for key in keys[1:]:
+            self.tails.delete(key, id)
+
+    def search(self, prefix, limit):
+        """Up to limit {id, name} matches: names starting with prefix in name
+        order, then names with a later word starting with it."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        ids = list(self.whole.scan(prefix, limit))
+        if len(ids) < limit:
+            seen = set(ids)
+            for id in self.tails.scan(prefix, limit * SCAN_FACTOR):
+                if id not in seen:
+                    seen.add(id)
+                    ids.append(id)
+                    if len(ids) == limit:
+                        break
+        return [{'id': id, 'name': self.names[id]} for id in ids]
+
+
+class Autocomplete(BackgroundIndex):
+
+    name = 'autocomplete'
+    max_age_setting = 'AUTOCOMPLETE_MAX_AGE'
+    MODELS = {'venue': Venue, 'artist': Artist}
+
+    def load(self):
+        indexes = {}
+        for kind, model in self.MODELS.items():
+            rows = db.session.query(model.id, model.name)\
+                .filter(model.name.isnot(None))\
+                .yield_per(BUILD_BATCH_SIZE)
+            indexes[kind] = PrefixIndex(rows)
+        return indexes
+
+    def search(self, kind, prefix, limit):
+        """Up to limit {id, name} matches of kind ('venue' or 'artist')."""
+        indexes = self.current()
+        if indexes is None:
+            return []
+        with self.lock:
+            return indexes[kind].search(prefix, limit)
+
+    def fetch(self, kind, id):
+        model = self.MODELS[kind]
+        return db.session.query(model.name).filter(model.id == id).first()
+
+    def apply(self, indexes, kind, id, row):
+        # A name is re-read, or dropped if the entity no longer exists.
+        index = indexes[kind]
+        index.remove(id)
+        if row is not None and row.name is not None:
+            index.add(id, row.name)
+
+
+autocomplete = Autocomplete()
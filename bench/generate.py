@@ -0,0 +1,205 @@
+"""Generate a seeded, realistically skewed dataset for benchmarking.
+
+    python -m bench.generate --venues 50000 --artists 50000 --shows 1000000
+
+States and genres come from the choice lists in forms.py. Areas follow the
+population of the larger US cities, venue popularity is Zipf-like (capped at
+one show per venue a day, as bookings may not overlap), and show dates span
+the last two years and the next one, so every page has both past and upcoming
+shows. Rows are loaded with COPY through the importer.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from forms import VenueForm
+import area_summary
+from geo import read_cities
+from importer import load_copy
+from partitions import ensure_partitions
+from model import db, Artist, Venue, Show
+
+STATES = [value for value, _ in VenueForm.state.kwargs['choices']]
+GENRES = [value for value, _ in VenueForm.genres.kwargs['choices']]
+
+# Larger cities per state with their populations in thousands.
+CITIES = {
+    'NY': [('New York', 8336), ('Buffalo', 278), ('Rochester', 211),
+           ('Syracuse', 148), ('Albany', 99)],
+    'CA': [('Los Angeles', 3898), ('San Diego', 1386), ('San Jose', 1013),
+           ('San Francisco', 808), ('Fresno', 542), ('Sacramento', 524),
+           ('Oakland', 433)],
+    'IL': [('Chicago', 2665), ('Aurora', 180), ('Naperville', 149)],
+    'TX': [('Houston', 2302), ('San Antonio', 1472), ('Dallas', 1299),
+           ('Austin', 974), ('Fort Worth', 956), ('El Paso', 678)],
+    'AZ': [('Phoenix', 1644), ('Tucson', 546), ('Mesa', 511)],
+    'PA': [('Philadelphia', 1567), ('Pittsburgh', 303)],
+    'FL': [('Jacksonville', 971), ('Miami', 449), ('Tampa', 398),
+           ('Orlando', 316)],
+    'OH': [('Columbus', 907), ('Cleveland', 362), ('Cincinnati', 309)],
+    'NC': [('Charlotte', 897), ('Raleigh', 482), ('Durham', 291)],
+    'WA': [('Seattle', 749), ('Spokane', 229), ('Tacoma', 221)],
+    'CO': [('Denver', 713), ('Colorado Springs', 486), ('Boulder', 105)],
+    'DC': [('Washington', 671)],
+    'MA': [('Boston', 650), ('Worcester', 206), ('Cambridge', 118)],
+    'TN': [('Nashville', 683), ('Memphis', 618), ('Knoxville', 195)],
+    'NV': [('Las Vegas', 656), ('Reno', 273)],
+    'OR': [('Portland', 635), ('Eugene', 178)],
+    'MI': [('Detroit', 620), ('Grand Rapids', 197), ('Ann Arbor', 123)],
+    'GA': [('Atlanta', 499), ('Savannah', 147), ('Athens', 127)],
+    'LA': [('New Orleans', 369), ('Baton Rouge', 222)],
+    'MN': [('Minneapolis', 425), ('Saint Paul', 303)],
+    'MO': [('Kansas City', 509), ('St. Louis', 286)],
+    'AL': [('Birmingham', 200), ('Huntsville', 215)],
+    'AK': [('Anchorage', 291)],
+    'AR': [('Little Rock', 202)],
+    'CT': [('Bridgeport', 148), ('New Haven', 135)],
+    'DE': [('Wilmington', 70)],
+    'HI': [('Honolulu', 350)],
+    'ID': [('Boise', 235)],
+    'IN': [('Indianapolis', 887), ('Bloomington', 79)],
+    'IA': [('Des Moines', 214)],
+    'KS': [('Wichita', 397), ('Lawrence', 95)],
+    'KY': [('Louisville', 633), ('Lexington', 322)],
+    'ME': [('Portland', 68)],
+    'MT': [('Billings', 117), ('Missoula', 75)],
+    'NE': [('Omaha', 486), ('Lincoln', 291)],
+    'NH': [('Manchester', 115)],
+    'NJ': [('Newark', 311), ('Jersey City', 292)],
+    'NM': [('Albuquerque', 564), ('Santa Fe', 88)],
+    'ND': [('Fargo', 125)],
+    'OK': [('Oklahoma City', 681), ('Tulsa', 413)],
+    'MD': [('Baltimore', 585)],
+    'MS': [('Jackson', 153)],
+    'RI': [('Providence', 190)],
+    'SC': [('Charleston', 150), ('Columbia', 136)],
+    'SD': [('Sioux Falls', 192)],
+    'UT': [('Salt Lake City', 200), ('Provo', 115)],
+    'VT': [('Burlington', 45)],
+    'VA': [('Virginia Beach', 459), ('Richmond', 226)],
+    'WV': [('Charleston', 48)],
+    'WI': [('Milwaukee', 577), ('Madison', 269)],
+    'WY': [('Cheyenne', 65)],
+}
+
+DAY = timedelta(days=1)
+
+
+def weighted_areas():
+    areas, weights = [], []
+    for state in STATES:
+        for city, population in CITIES[state]:
+            areas.append((city, state))
+            weights.append(population)
+    return areas, weights
+
+
+def zipf_weights(n, s=1.1):
+    return [1.0 / (rank ** s) for rank in range(1, n + 1)]
+
+
+def make_entity(rng, kind, number, areas, area_weights):
+    city, state = rng.choices(areas, area_weights)[0]
+    row = {
+        'name': '%s %s %d' % (rng.choice(['The', 'Blue', 'Red', 'Golden',
+                                          'Velvet', 'Electric', 'Midnight']),
+                              kind, number),
+        'city': city,
+        'state': state,
+        'phone': '%03d-%03d-%04d' % (rng.randint(200, 999),
+                                     rng.randint(200, 999),
+                                     rng.randint(0, 9999)),
+        'genres': rng.sample(GENRES, rng.choices([1, 2, 3, 4],
+                                                 [40, 35, 20, 5])[0]),
+        'image_link': 'https://picsum.photos/seed/%s%d/300' % (kind, number),
+        'facebook_link': 'https://www.facebook.com/%s%d' % (kind, number),
+        'website_link': 'https://example.com/%s/%d' % (kind.lower(), number),
+        'seeking_description': 'Looking for a good fit.',
+    }
+    return row
+
+
+def generate(venues, artists, shows, seed, chunk_size=10000):
+    rng = random.Random(seed)
+    areas, area_weights = weighted_areas()
+    centres = {(row['city'], row['state']): (row['latitude'], row['longitude'])
+               for row in read_cities()}
+
+    for model, kind, count, seeking in ((Venue, 'Venue', venues, 'seeking_talent'),
+                                        (Artist, 'Artist', artists, 'seeking_venue')):
+        started = time.perf_counter()
+        for offset in range(0, count, chunk_size):
+            rows = []
+            for number in range(offset, min(offset + chunk_size, count)):
+                row = make_entity(rng, kind, number, areas, area_weights)
+                row[seeking] = rng.random() < 0.3
+                if model is Venue:
+                    row['address'] = '%d %s St' % (rng.randint(1, 9999),
+                                                   rng.choice(['Main', 'Oak', 'Pine',
+                                                               'Market', 'Broadway']))
+                    # Spread over roughly 15 km around the city centre.
+                    latitude, longitude = centres[row['city'], row['state']]
+                    row['latitude'] = latitude + rng.uniform(-0.13, 0.13)
+                    row['longitude'] = longitude + rng.uniform(-0.17, 0.17)
+                rows.append(row)
+            load_copy(model, sorted(rows[0]), rows)
+            db.session.commit()
+        print('%d %s rows in %.1fs' % (count, kind, time.perf_counter() - started))
+
+    venue_ids = [id for id, in db.session.query(Venue.id).order_by(Venue.id)]
+    artist_ids = [id for id, in db.session.query(Artist.id).order_by(Artist.id)]
+    venue_weights = zipf_weights(len(venue_ids))
+    artist_weights = zipf_weights(len(artist_ids))
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    ensure_partitions(now - 730 * DAY, now + 366 * DAY)
+    db.session.commit()
+
+    # Venues host at most one show a day so that bookings never overlap; a
+    # draw that hits a booked (venue, day) is redrawn, which spreads the
+    # overflow of the most popular venues to the others.
+    venue_cum_weights = list(accumulate(venue_weights))
+    booked = set()
+    started = time.perf_counter()
+    for offset in range(0, shows, chunk_size):
+        size = min(chunk_size, shows - offset)
+        chosen_artists = rng.choices(artist_ids, artist_weights, k=size)
+        rows = []
+        for artist_id in chosen_artists:
+            while True:
+                venue_id = rng.choices(venue_ids, cum_weights=venue_cum_weights)[0]
+                day = rng.randint(-730, 365)
+                if (venue_id, day) not in booked:
+                    break
+            booked.add((venue_id, day))
+            rows.append({
+                'venue_id': venue_id,
+                'artist_id': artist_id,
+                'start_time': now + day * DAY
+                              + timedelta(hours=rng.choice([18, 19, 20, 21, 22])),
+            })
+        load_copy(Show, ['artist_id', 'start_time', 'venue_id'], rows)
+        db.session.commit()
+    print('%d Show rows in %.1fs' % (shows, time.perf_counter() - started))
+
+    db.session.execute('ANALYZE "Venue"; ANALYZE "Artist"; ANALYZE "Show"')
+    db.session.commit()
+    area_summary.refresh()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--venues', type=int, default=50000)
+    parser.add_argument('--artists', type=int, default=50000)
+    parser.add_argument('--shows', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    from bench.routes import make_app
+    with make_app().app_context():
+        generate(args.venues, args.artists, args.shows, args.seed)
+
+
+if __name__ == '__main__':
+    main()
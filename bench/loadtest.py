@@ -0,0 +1,327 @@
+"""Concurrent load test against a running instance.
+
+    python -m bench.loadtest http://127.0.0.1:5000 --concurrency 1 2 4 8 16 32 64 \
+        --duration 30 --mix browse=70 search=20 write=10 --output saturation.json
+
+Replays a weighted mix of browse (listing and detail pages), search (the two
+search POSTs) and write (create show / venue / artist) requests from a pool of
+concurrent clients, one step per concurrency level. Each step reports
+throughput, latency percentiles and the error rate, which together give the
+throughput-versus-latency saturation curve. /metrics is scraped before and
+after every step (and sampled during it) to show how long requests waited
+for a database connection; when that wait grows faster than SQL time, the
+connection pool rather than the database is the bottleneck. Under gunicorn
+/metrics adds up all the workers, each of which writes its metrics every
+METRICS_FLUSH_SECONDS (see instrumentation.py), so the last scrape of a step
+waits --metrics-settle seconds for them. Every step reports how many worker
+processes its metrics cover (procs): against a multi-worker server without
+METRICS_DIR it is 1, and the pool statistics are only meaningful when that
+server runs a single worker (WEB_CONCURRENCY=1).
+
+Only the standard library is used: requests go over asyncio streams with
+HTTP/1.1 keep-alive.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+
+from bench.routes import percentile
+
+METRIC_LINE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})? (\S+)$')
+
+
+class Connection(object):
+    """A keep-alive HTTP/1.1 connection with just enough parsing for the app's
+    responses (Content-Length and chunked bodies)."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, form=None):
+        body = urlencode(form, doseq=True).encode() if form else b''
+        head = ['%s %s HTTP/1.1' % (method, path),
+                'Host: %s:%d' % (self.host, self.port),
+                'Content-Length: %d' % len(body)]
+        if form:
+            head.append('Content-Type: application/x-www-form-urlencoded')
+        message = ('\r\n'.join(head) + '\r\n\r\n').encode() + body
+
+        # A reused connection may have been closed by the server while idle;
+        # that case is retried once on a fresh connection.
+        reused = self.writer is not None
+        while True:
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection(
+                    self.host, self.port)
+            try:
+                self.writer.write(message)
+                return await self.read_response()
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if not reused:
+                    raise
+                reused = False
+
+    async def read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed by server')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding') == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                chunks.append(await self.reader.readexactly(size + 2))
+                if size == 0:
+                    break
+            body = b''.join(chunk[:-2] for chunk in chunks)
+        elif 'content-length' in headers:
+            body = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            body = await self.reader.read()
+            self.close()
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class TrafficMix(object):
+
+    def __init__(self, rng, weights, venue_ids, artist_ids):
+        self.rng = rng
+        self.classes = list(weights)
+        self.weights = [weights[name] for name in self.classes]
+        self.venue_ids = venue_ids
+        self.artist_ids = artist_ids
+
+    def browse(self):
+        return self.rng.choice([
+            ('GET', '/venues', None),
+            ('GET', '/artists', None),
+            ('GET', '/shows', None),
+            ('GET', '/venues/%d' % self.rng.choice(self.venue_ids), None),
+            ('GET', '/artists/%d' % self.rng.choice(self.artist_ids), None),
+            ('GET', '/venues/%d' % self.rng.choice(self.venue_ids), None),
+            ('GET', '/artists/%d' % self.rng.choice(self.artist_ids), None),
+        ])
+
+    def search(self):
+        term = self.rng.choice(['rock', 'jazz', 'blue', 'san', 'new york',
+                                'velvet', 'CA', 'hip-hop'])
+        path = self.rng.choice(['/venues/search', '/artists/search'])
+        return 'POST', path, {'search_term': term}
+
+    def write(self):
+        kind = self.rng.choices(['show', 'venue', 'artist'], [80, 10, 10])[0]
+        if kind == 'show':
+            start = datetime.now() + timedelta(days=self.rng.randint(1, 365),
+                                               hours=self.rng.randint(0, 23))
+            return 'POST', '/shows/create', {
+                'venue_id': self.rng.choice(self.venue_ids),
+                'artist_id': self.rng.choice(self.artist_ids),
+                'start_time': start.strftime('%Y-%m-%d %H:%M:%S')}
+        form = {'name': 'Load %s %d' % (kind, self.rng.randint(0, 10 ** 9)),
+                'city': 'San Francisco', 'state': 'CA', 'phone': '415-000-0000',
+                'genres': ['Jazz'], 'facebook_link': 'https://www.facebook.com/load'}
+        if kind == 'venue':
+            form['address'] = '1 Market St'
+            return 'POST', '/venues/create', form
+        return 'POST', '/artists/create', form
+
+    def next(self):
+        traffic_class = self.rng.choices(self.classes, self.weights)[0]
+        return (traffic_class,) + getattr(self, traffic_class)()
+
+
+def parse_metrics(text):
+    values = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match:
+            name, labels, value = match.groups()
+            values[name + (labels or '')] = float(value)
+    return values
+
+
+def metric_total(metrics, name):
+    return sum(value for key, value in metrics.items()
+               if key == name or key.startswith(name + '{'))
+
+
+async def scrape(host, port):
+    connection = Connection(host, port)
+    try:
+        status, body = await connection.request('GET', '/metrics')
+        return parse_metrics(body.decode()) if status == 200 else {}
+    except (OSError, ValueError):
+        return {}
+    finally:
+        connection.close()
+
+
+async def sample_ids(host, port, path, key):
+    connection = Connection(host, port)
+    try:
+        status, body = await connection.request('GET', path)
+        if status != 200:
+            raise SystemExit('Could not read %s (HTTP %d)' % (path, status))
+        data = json.loads(body)
+        if key == 'areas':
+            return [venue['id'] for area in data['areas'] for venue in area['venues']]
+        return [item['id'] for item in data[key]]
+    finally:
+        connection.close()
+
+
+async def client(host, port, mix, deadline, samples):
+    connection = Connection(host, port)
+    while time.perf_counter() < deadline:
+        traffic_class, method, path, form = mix.next()
+        started = time.perf_counter()
+        try:
+            status, _ = await connection.request(method, path, form)
+            error = status >= 500
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            status, error = None, True
+        samples.append((traffic_class, time.perf_counter() - started, error))
+    connection.close()
+
+
+async def pool_sampler(host, port, deadline, peaks):
+    while time.perf_counter() < deadline:
+        metrics = await scrape(host, port)
+        peaks.append(metrics.get('fyyur_db_pool_checked_out', 0))
+        await asyncio.sleep(1)
+
+
+async def run_step(host, port, mix, concurrency, duration, settle):
+    before = await scrape(host, port)
+    samples, peaks = [], []
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(pool_sampler(host, port, deadline, peaks),
+                         *[client(host, port, mix, deadline, samples)
+                           for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(settle)
+    after = await scrape(host, port)
+
+    latencies = sorted(latency for _, latency, _ in samples)
+    errors = sum(1 for _, _, error in samples if error)
+    delta = lambda name: metric_total(after, name) - metric_total(before, name)
+    checkouts = delta('fyyur_db_pool_checkout_seconds_count')
+    requests = delta('fyyur_request_duration_seconds_count')
+
+    per_class = {}
+    for traffic_class in mix.classes:
+        class_latencies = sorted(latency for name, latency, _ in samples
+                                 if name == traffic_class)
+        per_class[traffic_class] = {
+            'requests': len(class_latencies),
+            'p95_ms': round(percentile(class_latencies, 0.95) * 1000, 2)
+                      if class_latencies else None,
+        }
+
+    return {
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        'error_rate': round(errors / len(samples), 4) if samples else None,
+        'pool_wait_ms_per_checkout': round(
+            delta('fyyur_db_pool_checkout_seconds_sum') / checkouts * 1000, 3)
+            if checkouts else None,
+        'sql_ms_per_request': round(
+            delta('fyyur_request_sql_seconds_sum') / requests * 1000, 3)
+            if requests else None,
+        'pool_timeouts': delta('fyyur_db_pool_timeouts_total'),
+        'pool_peak_checked_out': max(peaks) if peaks else None,
+        'pool_size': after.get('fyyur_db_pool_size'),
+        'metrics_processes': after.get('fyyur_metrics_processes'),
+        'classes': per_class,
+    }
+
+
+def parse_mix(values):
+    weights = {}
+    for value in values:
+        name, _, weight = value.partition('=')
+        if name not in ('browse', 'search', 'write'):
+            raise argparse.ArgumentTypeError('unknown traffic class %r' % name)
+        weights[name] = float(weight)
+    return {name: weight for name, weight in weights.items() if weight > 0}
+
+
+async def main_async(args):
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    rng = random.Random(args.seed)
+    venue_ids = await sample_ids(host, port, '/api/v1/venues', 'areas')
+    artist_ids = await sample_ids(host, port, '/api/v1/artists', 'artists')
+    if not venue_ids or not artist_ids:
+        raise SystemExit('No venues or artists to browse, seed the database first')
+    mix = TrafficMix(rng, parse_mix(args.mix), venue_ids, artist_ids)
+
+    print('%5s %9s %9s %9s %9s %7s %10s %10s %8s %5s' % (
+        'conc', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors',
+        'pool wait', 'sql/req', 'pool max', 'procs'))
+    steps = []
+    for concurrency in args.concurrency:
+        step = await run_step(host, port, mix, concurrency, args.duration,
+                              args.metrics_settle)
+        steps.append(step)
+        print('%5d %9.1f %9s %9s %9s %6.2f%% %8s ms %7s ms %8s %5s' % (
+            concurrency, step['throughput_rps'], step['p50_ms'], step['p95_ms'],
+            step['p99_ms'], (step['error_rate'] or 0) * 100,
+            step['pool_wait_ms_per_checkout'], step['sql_ms_per_request'],
+            step['pool_peak_checked_out'], step['metrics_processes']))
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('url', help='Base URL of the running app.')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument('--duration', type=float, default=30,
+                        help='Seconds per concurrency step.')
+    parser.add_argument('--mix', nargs='+', default=['browse=70', 'search=20', 'write=10'],
+                        help='Traffic class weights.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--metrics-settle', type=float, default=2,
+                        help='Seconds to wait for the workers to write their '
+                             'metrics before the last scrape of a step.')
+    parser.add_argument('--output', help='Write the saturation curve as JSON.')
+    args = parser.parse_args()
+
+    steps = asyncio.run(main_async(args))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'url': args.url, 'mix': parse_mix(args.mix),
+                       'duration': args.duration, 'steps': steps}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
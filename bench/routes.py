@@ -0,0 +1,241 @@
+"""Benchmark every route of the app through the Flask test client.
+
+    python -m bench.routes --iterations 100 --save baseline
+    python -m bench.routes --iterations 100 --compare baseline
+
+Runs against the database in FYYUR_BENCH_DATABASE_URI (default: the one in
+config.py), which should be filled with `python -m bench.generate`. For each
+route it reports p50/p95/p99 latency, SQL statements per request and the
+peak RSS of the process after the route ran. Results can be saved as a
+baseline JSON file in bench/baselines/ and later runs compared against it.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+
+
+def make_app(**settings):
+    from app import create_app
+    uri = os.environ.get('FYYUR_BENCH_DATABASE_URI')
+    if uri:
+        settings.setdefault('SQLALCHEMY_DATABASE_URI', uri)
+    return create_app(**settings)
+
+
+class QueryCounter(object):
+
+    def __init__(self):
+        self.count = 0
+        event.listen(Engine, 'before_cursor_execute', self.on_execute)
+
+    def on_execute(self, *args):
+        self.count += 1
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def sample_ids():
+    from model import db, Artist, Venue
+    venue_ids = [id for id, in db.session.query(Venue.id).limit(10000)]
+    artist_ids = [id for id, in db.session.query(Artist.id).limit(10000)]
+    if not venue_ids or not artist_ids:
+        sys.exit('The benchmark database is empty, run python -m bench.generate')
+    deep_venue = db.session.query(Venue.state, Venue.city, Venue.name, Venue.id)\
+        .order_by(Venue.state.desc(), Venue.city.desc(), Venue.name.desc(),
+                  Venue.id.desc()).offset(100).first()
+    deep_artist = db.session.query(Artist.name, Artist.id)\
+        .order_by(Artist.name.desc(), Artist.id.desc()).offset(100).first()
+    db.session.remove()
+    return venue_ids, artist_ids, deep_venue, deep_artist
+
+
+def build_routes(rng, venue_ids, artist_ids, deep_venue, deep_artist, writes):
+    from pagination import encode_cursor
+
+    venue = lambda: rng.choice(venue_ids)
+    artist = lambda: rng.choice(artist_ids)
+    now = datetime.now()
+    week = lambda: (now + timedelta(days=rng.randint(-700, 300))).date()
+    terms = ['rock', 'jazz', 'blue', 'san', 'new york', 'velvet 12', 'CA']
+
+    routes = [
+        ('index', lambda: ('GET', '/', None)),
+        ('venues', lambda: ('GET', '/venues', None)),
+        ('venues_deep_page', lambda: ('GET', '/venues?after=' + encode_cursor(deep_venue), None)),
+        ('show_venue', lambda: ('GET', '/venues/%d' % venue(), None)),
+        ('edit_venue', lambda: ('GET', '/venues/%d/edit' % venue(), None)),
+        ('search_venues', lambda: ('POST', '/venues/search', {'search_term': rng.choice(terms)})),
+        ('create_venue_form', lambda: ('GET', '/venues/create', None)),
+        ('artists', lambda: ('GET', '/artists', None)),
+        ('artists_deep_page', lambda: ('GET', '/artists?after=' + encode_cursor(deep_artist), None)),
+        ('show_artist', lambda: ('GET', '/artists/%d' % artist(), None)),
+        ('edit_artist', lambda: ('GET', '/artists/%d/edit' % artist(), None)),
+        ('search_artists', lambda: ('POST', '/artists/search', {'search_term': rng.choice(terms)})),
+        ('create_artist_form', lambda: ('GET', '/artists/create', None)),
+        ('shows', lambda: ('GET', '/shows', None)),
+        ('create_show_form', lambda: ('GET', '/shows/create', None)),
+        ('export_shows_week', lambda: ('GET', '/shows/export.ndjson?start=%s&end=%s' % (
+            week(), week() + timedelta(days=7)), None)),
+        ('export_venue_shows', lambda: ('GET', '/shows/export.csv?venue_id=%d' % venue(), None)),
+        ('api_venues', lambda: ('GET', '/api/v1/venues', None)),
+        ('api_venue', lambda: ('GET', '/api/v1/venues/%d' % venue(), None)),
+        ('api_venues_nearby', lambda: ('GET', '/api/v1/venues/nearby?lat=%.4f&lng=%.4f' % (
+            rng.uniform(26, 48), rng.uniform(-123, -71)), None)),
+        ('api_autocomplete', lambda: ('GET', '/api/v1/autocomplete?type=%s&q=%s' % (
+            rng.choice(['venue', 'artist']), rng.choice(terms)[:3]), None)),
+        ('api_artists', lambda: ('GET', '/api/v1/artists', None)),
+        ('api_artist', lambda: ('GET', '/api/v1/artists/%d' % artist(), None)),
+        ('api_shows', lambda: ('GET', '/api/v1/shows', None)),
+        ('metrics', lambda: ('GET', '/metrics', None)),
+    ]
+    if writes:
+        venue_form = lambda: {'name': 'Bench Venue %d' % rng.randint(0, 10 ** 9),
+                              'city': 'San Francisco', 'state': 'CA',
+                              'address': '1 Market St', 'phone': '415-000-0000',
+                              'genres': ['Jazz', 'Blues'],
+                              'facebook_link': 'https://www.facebook.com/bench'}
+        artist_form = lambda: {'name': 'Bench Artist %d' % rng.randint(0, 10 ** 9),
+                               'city': 'San Francisco', 'state': 'CA',
+                               'phone': '415-000-0000', 'genres': ['Jazz'],
+                               'facebook_link': 'https://www.facebook.com/bench'}
+        routes += [
+            ('create_venue', lambda: ('POST', '/venues/create', venue_form())),
+            ('create_artist', lambda: ('POST', '/artists/create', artist_form())),
+            ('create_show', lambda: ('POST', '/shows/create', {
+                'venue_id': venue(), 'artist_id': artist(),
+                'start_time': (now + timedelta(days=rng.randint(1, 365)))
+                .strftime('%Y-%m-%d %H:%M:%S')})),
+            ('edit_venue_submission', lambda: ('POST', '/venues/%d/edit' % venue(), venue_form())),
+            ('edit_artist_submission', lambda: ('POST', '/artists/%d/edit' % artist(), artist_form())),
+        ]
+    return routes
+
+
+def run_route(client, counter, make_request, iterations, warmup):
+    latencies, queries, statuses = [], [], set()
+    for iteration in range(warmup + iterations):
+        method, path, data = make_request()
+        before = counter.count
+        started = time.perf_counter()
+        response = client.open(path, method=method, data=data)
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        response.close()
+        if iteration >= warmup:
+            latencies.append(elapsed)
+            queries.append(counter.count - before)
+            statuses.add(response.status_code)
+    latencies.sort()
+    return {
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'queries_per_request': round(sum(queries) / len(queries), 2),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'statuses': sorted(statuses),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print('\n%-24s %12s %12s %10s' % ('route', 'p50 change', 'p95 change', 'queries'))
+    for name, current in results['routes'].items():
+        previous = baseline['routes'].get(name)
+        if previous is None:
+            continue
+        p50 = current['p50_ms'] / previous['p50_ms'] - 1 if previous['p50_ms'] else 0
+        p95 = current['p95_ms'] / previous['p95_ms'] - 1 if previous['p95_ms'] else 0
+        queries = current['queries_per_request'] - previous['queries_per_request']
+        print('%-24s %+11.1f%% %+11.1f%% %+10.2f' % (name, p50 * 100, p95 * 100, queries))
+        if p95 > tolerance or queries > 0:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--routes', nargs='*', help='Only run these routes.')
+    parser.add_argument('--writes', action='store_true',
+                        help='Also benchmark the create and edit submissions.')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Build every page from the database.')
+    parser.add_argument('--save', metavar='NAME', help='Save results as a baseline.')
+    parser.add_argument('--compare', metavar='NAME', help='Compare with a baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='Allowed p95 slowdown before failing a comparison.')
+    args = parser.parse_args()
+
+    # Without caching, neither page data nor template fragments are kept.
+    app = make_app(**({'CACHE_DEFAULT_TIMEOUT': 0, 'FRAGMENT_CACHE_MAX_ENTRIES': 0}
+                      if args.no_cache else {}))
+    counter = QueryCounter()
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        ids = sample_ids()
+    routes = build_routes(rng, *ids, writes=args.writes)
+    if args.routes:
+        routes = [route for route in routes if route[0] in args.routes]
+
+    results = {
+        'commit': git_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'iterations': args.iterations,
+        'cache': not args.no_cache,
+        'routes': {},
+    }
+    client = app.test_client()
+    print('%-24s %9s %9s %9s %8s %10s' % ('route', 'p50 ms', 'p95 ms', 'p99 ms',
+                                           'queries', 'peak RSS'))
+    for name, make_request in routes:
+        result = run_route(client, counter, make_request, args.iterations, args.warmup)
+        results['routes'][name] = result
+        print('%-24s %9.2f %9.2f %9.2f %8.1f %8d KB' % (
+            name, result['p50_ms'], result['p95_ms'], result['p99_ms'],
+            result['queries_per_request'], result['peak_rss_kb']))
+
+    if args.save:
+        path = os.path.join(BASELINE_DIR, args.save + '.json')
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('\nSaved %s' % path)
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, args.compare + '.json')) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print('\nRegressed: %s' % ', '.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
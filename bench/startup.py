@@ -0,0 +1,115 @@
+"""Benchmark worker startup: interpreter start to the first response.
+
+    python -m bench.startup --runs 10 --save startup-baseline
+    python -m bench.startup --runs 10 --compare startup-baseline
+
+Each run starts a fresh `python -X importtime` process that builds the app
+with create_app() and serves one request through the test client (by
+default the home page, which needs no database). It reports the median and
+best wall time to that first response, the cumulative import time of the
+app module, and the slowest top-level imports of the last run.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from bench.routes import BASELINE_DIR, git_commit, percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# os._exit skips waiting for the app's background threads.
+CHILD = """
+import os, sys
+from app import create_app
+app = create_app()
+response = app.test_client().get(sys.argv[1])
+sys.stdout.write('%d\\n' % response.status_code)
+sys.stdout.flush()
+os._exit(0)
+"""
+
+
+def parse_importtime(stderr):
+    """(module, self us, cumulative us, depth) for each import."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def run_once(path):
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD, path],
+                             cwd=ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if process.returncode != 0 or not process.stdout.strip():
+        sys.exit('Startup run failed:\n' + process.stderr[-2000:])
+    return elapsed, int(process.stdout.split()[0]), parse_importtime(process.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/', help='The first request.')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of slowest imports to list.')
+    parser.add_argument('--save', metavar='NAME', help='Save results as a baseline.')
+    parser.add_argument('--compare', metavar='NAME', help='Compare with a baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='Allowed slowdown of the median before failing a comparison.')
+    args = parser.parse_args()
+
+    timings, app_imports = [], []
+    for _ in range(args.runs):
+        elapsed, status, imports = run_once(args.path)
+        timings.append(elapsed)
+        app_imports.append(next(cumulative for name, _, cumulative, depth in imports
+                                if name == 'app' and depth == 0))
+    timings.sort()
+    app_imports.sort()
+
+    results = {
+        'commit': git_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'runs': args.runs,
+        'path': args.path,
+        'status': status,
+        'first_response_ms': round(percentile(timings, 0.5) * 1000, 1),
+        'first_response_best_ms': round(timings[0] * 1000, 1),
+        'app_import_ms': round(percentile(app_imports, 0.5) / 1000, 1),
+    }
+    print('first response   %8.1f ms median, %.1f ms best (status %d)' % (
+        results['first_response_ms'], results['first_response_best_ms'], status))
+    print('import app       %8.1f ms median' % results['app_import_ms'])
+    print('\nslowest imports (cumulative, last run):')
+    slowest = sorted((entry for entry in imports if entry[3] <= 1),
+                     key=lambda entry: -entry[2])[:args.top]
+    for name, _, cumulative, depth in slowest:
+        print('  %-40s %8.1f ms' % ('  ' * depth + name, cumulative / 1000))
+
+    if args.save:
+        path = os.path.join(BASELINE_DIR, args.save + '.json')
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('\nSaved %s' % path)
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, args.compare + '.json')) as f:
+            baseline = json.load(f)
+        change = results['first_response_ms'] / baseline['first_response_ms'] - 1
+        print('\nfirst response %+.1f%% against %s' % (change * 100, args.compare))
+        if change > args.tolerance:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+from datetime import timedelta
+
+from sqlalchemy import DateTime, Integer, column, func, literal, table, text
+from sqlalchemy.dialects.postgresql import TSRANGE
+
+from model import db, Venue
+from pagination import keyset_page
+
+# ----------------------------------------------------------------------------#
+# Venue calendar.
+# ----------------------------------------------------------------------------#
+# Every show occupies its venue from start_time for duration_minutes. The
+# occupied ranges live in venue_booking, maintained by a trigger on "Show",
+# whose exclusion constraint rejects overlapping shows at the same venue.
+# Both the conflict check and the free/busy lookup are range overlap (&&)
+# queries on the constraint's GiST index over (venue_id, during); free time
+# is computed in SQL from the gaps between consecutive bookings.
+
+venue_booking = table(
+    'venue_booking',
+    column('show_id', Integer),
+    column('venue_id', Integer),
+    column('during', TSRANGE),
+)
+
+
+def overlapping(start, end):
+    return venue_booking.c.during.op('&&')(func.tsrange(start, end))
+
+
+def first_conflict(venue_id, start_time, duration_minutes):
+    """The earliest booking at the venue overlapping the given slot, or None."""
+    end_time = start_time + timedelta(minutes=duration_minutes)
+    during = venue_booking.c.during
+    return db.session.query(venue_booking.c.show_id,
+                            func.lower(during).label('busy_from'),
+                            func.upper(during).label('busy_until'))\
+        .filter(venue_booking.c.venue_id == venue_id)\
+        .filter(overlapping(start_time, end_time))\
+        .order_by(func.lower(during))\
+        .first()
+
+
+def conflicts(slots):
+    """For many (venue_id, start_time, end_time) slots at once, a dict from
+    the position of each slot overlapping an existing booking to the
+    earliest such booking's (busy_from, busy_until). One query: each slot is
+    looked up in the GiST index."""
+    if not slots:
+        return {}
+    venue_ids, starts, ends = zip(*slots)
+    rows = db.session.execute(text("""
+        SELECT DISTINCT ON (slot.position)
+               slot.position, lower(booking.during), upper(booking.during)
+        FROM unnest(CAST(:venue_ids AS integer[]),
+                    CAST(:starts AS timestamp[]), CAST(:ends AS timestamp[]))
+             WITH ORDINALITY AS slot(venue_id, start_time, end_time, position)
+        JOIN venue_booking AS booking
+          ON booking.venue_id = slot.venue_id
+         AND booking.during && tsrange(slot.start_time, slot.end_time)
+        ORDER BY slot.position, lower(booking.during)
+    """), {'venue_ids': list(venue_ids), 'starts': list(starts),
+           'ends': list(ends)})
+    return {position - 1: (busy_from, busy_until)
+            for position, busy_from, busy_until in rows}
+
+
+def busy_query(venue_ids, start, end):
+    during = venue_booking.c.during
+    return db.session.query(venue_booking.c.venue_id,
+                            venue_booking.c.show_id,
+                            func.lower(during).label('busy_from'),
+                            func.upper(during).label('busy_until'))\
+        .filter(venue_booking.c.venue_id.in_(venue_ids))\
+        .filter(overlapping(start, end))
+
+
+def free_query(venue_ids, start, end):
+    # A zero-length booking at the end of the window closes the last gap,
+    # and gives venues without bookings a single gap over the whole window.
+    end_marker = literal(end, DateTime)
+    busy = busy_query(venue_ids, start, end)\
+        .with_entities(venue_booking.c.venue_id.label('venue_id'),
+                       func.lower(venue_booking.c.during).label('busy_from'),
+                       func.upper(venue_booking.c.during).label('busy_until'))
+    closing = db.session.query(Venue.id.label('venue_id'),
+                               end_marker.label('busy_from'),
+                               end_marker.label('busy_until'))\
+        .filter(Venue.id.in_(venue_ids))
+    slots = busy.union_all(closing).subquery()
+
+    # Bookings of one venue never overlap, so each gap runs from the end of
+    # the previous booking to the start of the next.
+    previous_end = func.lag(slots.c.busy_until).over(
+        partition_by=slots.c.venue_id, order_by=slots.c.busy_from)
+    gaps = db.session.query(
+            slots.c.venue_id,
+            func.greatest(func.coalesce(previous_end, start), start).label('free_from'),
+            func.least(slots.c.busy_from, end).label('free_until'))\
+        .subquery()
+    return db.session.query(gaps)\
+        .filter(gaps.c.free_from < gaps.c.free_until)\
+        .order_by(gaps.c.venue_id, gaps.c.free_from)
+
+
+def free_busy(venue_query, start, end, cursor=None):
+    """Busy and free intervals between start and end for a page of the
+    venues selected by venue_query (a query on Venue)."""
+    page = keyset_page(venue_query.with_entities(Venue.id, Venue.name,
+                                                 Venue.city, Venue.state),
+                       [Venue.id], cursor=cursor)
+    venues = {}
+    for row in page.items:
+        venues[row.id] = {
+            'id': row.id,
+            'name': row.name,
+            'city': row.city,
+            'state': row.state,
+            'busy': [],
+            'free': []
+        }
+
+    if venues:
+        venue_ids = list(venues)
+        busy = busy_query(venue_ids, start, end)\
+            .order_by(venue_booking.c.venue_id, 'busy_from')
+        for row in busy:
+            venues[row.venue_id]['busy'].append({
+                'show_id': row.show_id,
+                'start': row.busy_from.isoformat(),
+                'end': row.busy_until.isoformat()
+            })
+        for row in free_query(venue_ids, start, end):
+            venues[row.venue_id]['free'].append({
+                'start': row.free_from.isoformat(),
+                'end': row.free_until.isoformat()
+            })
+
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'venues': list(venues.values()),
+        'next_cursor': page.next_cursor
+    }
+
+
+def forget_shows(show_table):
+    """Delete the bookings of the shows in show_table, a partition about to be
+    detached from "Show"."""
+    db.session.execute('DELETE FROM venue_booking USING "%s" '
+                       'WHERE venue_booking.show_id = "%s".id'
+                       % (show_table, show_table))
@@ -0,0 +1,171 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from werkzeug.utils import import_string
+
+from replicas import reading_from_replica
+
+# ----------------------------------------------------------------------------#
+# Cache backends.
+# ----------------------------------------------------------------------------#
+
+
+class CacheBackend(object):
+    """Interface for cache storage. A timeout of None means no expiry."""
+
+    @classmethod
+    def from_config(cls, config):
+        return cls()
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, timeout=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """In-process cache bounded by entry count, with per-entry expiry."""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(max_entries=config['CACHE_MAX_ENTRIES'])
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+BACKENDS = {
+    'lru': LRUCache,
+}
+
+# ----------------------------------------------------------------------------#
+# Cache.
+# ----------------------------------------------------------------------------#
+# Entries are grouped in namespaces ('venue:3', 'shows', ...). Each namespace
+# has a random token that is part of the keys of its entries; invalidating a
+# namespace drops the token, which orphans all of its entries at once without
+# having to enumerate them. Orphans age out through the backend's eviction.
+
+
+class Cache(object):
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.default_timeout = None
+        self.replica_settle_seconds = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config['CACHE_BACKEND']
+        backend_cls = BACKENDS[backend] if backend in BACKENDS \
+            else import_string(backend)
+        self.backend = backend_cls.from_config(app.config)
+        self.default_timeout = app.config['CACHE_DEFAULT_TIMEOUT']
+        self.replica_settle_seconds = app.config['CACHE_REPLICA_SETTLE_SECONDS']
+        app.extensions['cache'] = self
+
+    def _token(self, namespace):
+        key = 'ns:' + namespace
+        token = self.backend.get(key)
+        if token is None:
+            token = uuid.uuid4().hex
+            self.backend.set(key, token)
+        return token
+
+    def entry_key(self, key, namespaces=()):
+        """The backend key for key in namespaces. It changes whenever one of
+        the namespaces is invalidated."""
+        tokens = [self._token(namespace) for namespace in namespaces]
+        return ':'.join([key] + tokens)
+
+    def get(self, entry_key):
+        return self.backend.get(entry_key)
+
+    def set(self, entry_key, value, timeout=None):
+        self.backend.set(entry_key, value, timeout)
+
+    def storable(self, namespaces):
+        """False while a value built now could predate a recent write: when
+        reading from a replica shortly after one of the namespaces changed."""
+        return not (reading_from_replica() and
+                    any(self.backend.get('settling:' + namespace)
+                        for namespace in namespaces))
+
+    def memoize(self, key, build, namespaces=(), expires_at=None):
+        """Return the cached value for key, building and storing it on a miss.
+
+        expires_at, if given, is called with the built value and may return a
+        datetime after which the value is stale (for example when an upcoming
+        show starts); the entry's timeout is shortened accordingly.
+        """
+        full_key = self.entry_key(key, namespaces)
+        value = self.backend.get(full_key)
+        if value is not None:
+            return value
+
+        value = build()
+        if value is None:
+            return None
+        timeout = self.default_timeout
+        deadline = expires_at(value) if expires_at else None
+        if deadline is not None:
+            remaining = max(0, (deadline - datetime.now()).total_seconds())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        if (timeout is None or timeout > 0) and self.storable(namespaces):
+            self.backend.set(full_key, value, timeout)
+        return value
+
+    def invalidate(self, *namespaces):
+        for namespace in namespaces:
+            self.backend.delete('ns:' + namespace)
+            # A replica may not have replayed the write yet.
+            if self.replica_settle_seconds:
+                self.backend.set('settling:' + namespace, True,
+                                 self.replica_settle_seconds)
+
+    def clear(self):
+        self.backend.clear()
+
+
+cache = Cache()
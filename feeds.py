@@ -0,0 +1,208 @@
+import hashlib
+from datetime import date, datetime, timedelta
+
+from flask import (Blueprint, abort, current_app, request,
+                   stream_with_context, url_for)
+from sqlalchemy import func
+
+import queries
+from cache import cache
+from export import BATCH_SIZE
+from model import db, Artist, Venue, Show
+
+# ----------------------------------------------------------------------------#
+# Calendar feeds.
+# ----------------------------------------------------------------------------#
+# iCalendar (RFC 5545) feeds of the shows of a venue, an artist or a city,
+# from FEED_PAST_DAYS ago to FEED_FUTURE_DAYS ahead. A feed is one start_time
+# range query over the (venue_id, start_time) or (artist_id, start_time)
+# index, pruned to the partitions of the window, streamed through a
+# server-side cursor as it is serialized.
+#
+# The ETag of a feed is derived from the window, the calendar name and the
+# version counters that the page versions migration keeps on "Venue" and
+# "Artist": the version of the venue or the artist, or for a city the
+# number, ids and sum of the versions of its venues, read from the
+# (state, city) index. Every worker derives the same ETag for the same data,
+# so a poll carrying it is answered 304 by any of them without reading the
+# shows. The serialized feed is cached under its ETag, in the namespace of
+# its scope.
+
+CONTENT_TYPE = 'text/calendar; charset=utf-8'
+
+feeds = Blueprint('feeds', __name__)
+
+
+def escape(text):
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;')\
+        .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def fold(line):
+    # Content lines are folded at 75 octets, continuation lines start with a
+    # space; multi-byte characters are not split.
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts, limit = [], 75
+    while len(encoded) > limit:
+        cut = limit
+        while cut and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded, limit = encoded[cut:], 74
+    parts.append(encoded.decode('utf-8'))
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def ical_time(value):
+    # Shows are stored in local time without a zone: "floating" times.
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def event_lines(show):
+    end_time = show.start_time + timedelta(minutes=show.duration_minutes)
+    location = ', '.join(part for part in (show.venue_name, show.address,
+                                           show.city, show.state) if part)
+    return [
+        'BEGIN:VEVENT',
+        'UID:show-%d@%s' % (show.id, request.host),
+        'DTSTAMP:' + show.stamp.strftime('%Y%m%dT%H%M%SZ'),
+        'DTSTART:' + ical_time(show.start_time),
+        'DTEND:' + ical_time(end_time),
+        'SUMMARY:' + escape('%s at %s' % (show.artist_name, show.venue_name)),
+        'LOCATION:' + escape(location),
+        'URL:' + url_for('venues.show_venue', venue_id=show.venue_id, _external=True),
+        'END:VEVENT',
+    ]
+
+
+def calendar_chunks(name, rows):
+    header = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Fyyur//Shows//EN',
+              'CALSCALE:GREGORIAN', 'METHOD:PUBLISH',
+              'X-WR-CALNAME:' + escape(name)]
+    yield ''.join(fold(line) for line in header)
+    lines = []
+    for count, show in enumerate(rows, 1):
+        lines.extend(fold(line) for line in event_lines(show))
+        if count % BATCH_SIZE == 0:
+            yield ''.join(lines)
+            lines = []
+    lines.append(fold('END:VCALENDAR'))
+    yield ''.join(lines)
+
+
+def window():
+    today = date.today()
+    start = datetime.combine(today, datetime.min.time()) \
+        - timedelta(days=current_app.config['FEED_PAST_DAYS'])
+    end = datetime.combine(today, datetime.min.time()) \
+        + timedelta(days=current_app.config['FEED_FUTURE_DAYS'] + 1)
+    return start, end
+
+
+def feed_query(start, end):
+    # The stamp of an event is the last update of its show, venue or artist,
+    # in UTC: the same feed is serialized to the same bytes by every worker.
+    stamp = queries.utc(func.greatest(Show.updated_at, Venue.updated_at,
+                                      Artist.updated_at))
+    return Show.query.join(Venue, Venue.id == Show.venue_id)\
+        .join(Artist, Artist.id == Show.artist_id)\
+        .with_entities(Show.id, Show.venue_id, Show.start_time,
+                       Show.duration_minutes, Venue.name.label('venue_name'),
+                       Venue.address, Venue.city, Venue.state,
+                       Artist.name.label('artist_name'), stamp.label('stamp'))\
+        .filter(Show.start_time >= start, Show.start_time < end)\
+        .order_by(Show.start_time, Show.id)
+
+
+def feed_response(key, namespaces, build):
+    """Serve the feed of build(start, end), which returns (calendar name,
+    rows query, version), or None for an unknown scope. The feed is cached
+    under key and namespaces."""
+    start, end = window()
+    built = build(start, end)
+    if built is None:
+        abort(404)
+    name, query, version = built
+    etag = hashlib.sha1(repr((key, request.host, name, start, version))
+                        .encode()).hexdigest()
+    max_age = current_app.config['FEED_MAX_AGE']
+
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        response.cache_control.max_age = max_age
+        return response
+    entry_key = cache.entry_key('feed:%s:%s' % (key, etag), namespaces)
+    body = cache.get(entry_key)
+    if body is not None:
+        response = current_app.response_class(body, content_type=CONTENT_TYPE)
+        response.set_etag(etag)
+        response.cache_control.max_age = max_age
+        return response
+
+    rows = query.execution_options(stream_results=True).yield_per(BATCH_SIZE)
+    storable = cache.storable(namespaces)
+    max_bytes = current_app.config['FEED_CACHE_MAX_BYTES']
+    timeout = cache.default_timeout
+
+    def chunks():
+        parts, size = [], 0
+        for chunk in calendar_chunks(name, rows):
+            if parts is not None:
+                parts.append(chunk)
+                size += len(chunk)
+                if size > max_bytes:
+                    parts = None
+            yield chunk
+        if parts is not None and storable and (timeout is None or timeout > 0):
+            cache.set(entry_key, ''.join(parts), timeout)
+
+    response = current_app.response_class(stream_with_context(chunks()),
+                                          content_type=CONTENT_TYPE)
+    response.set_etag(etag)
+    response.cache_control.max_age = max_age
+    return response
+
+
+@feeds.route('/venues/<int:venue_id>/calendar.ics')
+def venue_feed(venue_id):
+    def build(start, end):
+        venue = db.session.query(Venue.name, Venue.version)\
+            .filter(Venue.id == venue_id).first()
+        if venue is None:
+            return None
+        return ('Shows at %s' % venue.name,
+                feed_query(start, end).filter(Show.venue_id == venue_id),
+                venue.version)
+    return feed_response('venue:%d' % venue_id, [f'venue:{venue_id}'], build)
+
+
+@feeds.route('/artists/<int:artist_id>/calendar.ics')
+def artist_feed(artist_id):
+    def build(start, end):
+        artist = db.session.query(Artist.name, Artist.version)\
+            .filter(Artist.id == artist_id).first()
+        if artist is None:
+            return None
+        return ('Shows by %s' % artist.name,
+                feed_query(start, end).filter(Show.artist_id == artist_id),
+                artist.version)
+    return feed_response('artist:%d' % artist_id, [f'artist:{artist_id}'], build)
+
+
+@feeds.route('/calendar/<state>/<city>.ics')
+def area_feed(state, city):
+    def build(start, end):
+        # A venue joining or leaving the city changes the count and the ids.
+        version = db.session.query(func.count(Venue.id), func.sum(Venue.id),
+                                   func.sum(Venue.version))\
+            .filter(Venue.state == state, Venue.city == city)\
+            .one()
+        return ('Shows in %s, %s' % (city, state),
+                feed_query(start, end).filter(Venue.state == state,
+                                              Venue.city == city),
+                tuple(version))
+    namespace = queries.area_namespace(city, state)
+    return feed_response(namespace, [namespace], build)
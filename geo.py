@@ -0,0 +1,111 @@
+import csv
+import os
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import Float, String, column, func, table
+
+from area_summary import venue_area_summary
+from model import db, Venue
+
+# ----------------------------------------------------------------------------#
+# Venue locations.
+# ----------------------------------------------------------------------------#
+# Venues are placed at the centre of their city, looked up in the local
+# city_location table (no network geocoding). A trigger on "Venue" fills in
+# latitude and longitude when a venue is created without them or changes
+# city; `flask geocode load` adds cities from a CSV gazetteer.
+#
+# Nearest-venue queries go through a GiST index on
+# ll_to_earth(latitude, longitude) (cube and earthdistance): k nearest is an
+# index-ordered scan on <->, a radius search is an earth_box containment scan
+# rechecked with earth_distance.
+
+CITIES_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'data', 'us_cities.csv')
+
+city_location = table(
+    'city_location',
+    column('city', String),
+    column('state', String),
+    column('latitude', Float),
+    column('longitude', Float),
+)
+
+
+def read_cities(path=CITIES_CSV):
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield {'city': row['city'], 'state': row['state'],
+                   'latitude': float(row['latitude']),
+                   'longitude': float(row['longitude'])}
+
+
+def locate(city, state):
+    """(latitude, longitude) of a known city, or None."""
+    return db.session.query(city_location.c.latitude,
+                            city_location.c.longitude)\
+        .filter(city_location.c.state == state)\
+        .filter(func.lower(city_location.c.city) == func.lower(city))\
+        .first()
+
+
+def nearby(latitude, longitude, limit, radius_km=None):
+    """The venues closest to a point, nearest first, with their distance in
+    km and upcoming show count; within radius_km if given."""
+    here = func.ll_to_earth(latitude, longitude)
+    location = func.ll_to_earth(Venue.latitude, Venue.longitude)
+    summary = venue_area_summary.c
+    # The index is partial on latitude IS NOT NULL, so the filter is needed
+    # for the planner to use it.
+    query = db.session.query(Venue.id, Venue.name, Venue.address, Venue.city,
+                             Venue.state, Venue.latitude, Venue.longitude,
+                             (func.earth_distance(location, here) / 1000)
+                             .label('distance_km'),
+                             func.coalesce(summary.num_upcoming_shows, 0)
+                             .label('num_upcoming_shows'))\
+        .outerjoin(venue_area_summary, summary.venue_id == Venue.id)\
+        .filter(Venue.latitude.isnot(None))
+    if radius_km is not None:
+        meters = radius_km * 1000
+        query = query\
+            .filter(func.earth_box(here, meters).op('@>')(location))\
+            .filter(func.earth_distance(location, here) <= meters)
+    return query.order_by(location.op('<->')(here)).limit(limit).all()
+
+
+geocode_command = AppGroup('geocode', help='Maintain venue coordinates.')
+
+
+@geocode_command.command('load')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def load_command(path):
+    """Add or update cities from a CSV with city, state, latitude and
+    longitude columns, then locate the venues in them."""
+    rows = list(read_cities(path))
+    statement = """
+        INSERT INTO city_location (city, state, latitude, longitude)
+        VALUES (:city, :state, :latitude, :longitude)
+        ON CONFLICT (state, city) DO UPDATE
+        SET latitude = excluded.latitude, longitude = excluded.longitude"""
+    try:
+        db.session.execute(statement, rows)
+        located = locate_venues()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    click.echo('%d cities loaded, %d venues located' % (len(rows), located))
+
+
+def locate_venues():
+    """Set the coordinates of venues whose city is known but that have none.
+    The caller commits."""
+    return db.session.execute("""
+        UPDATE "Venue"
+        SET latitude = city_location.latitude,
+            longitude = city_location.longitude
+        FROM city_location
+        WHERE "Venue".latitude IS NULL
+          AND city_location.state = "Venue".state
+          AND lower(city_location.city) = lower("Venue".city)""").rowcount
@@ -0,0 +1,139 @@
+import gc
+import multiprocessing
+import os
+import tempfile
+
+# ----------------------------------------------------------------------------#
+# Production server.
+# ----------------------------------------------------------------------------#
+#     gunicorn              (reads this file from the working directory)
+#
+# A prefork server: the master imports and builds the app and compiles every
+# template once, then forks the workers, which share those pages copy-on-write
+# until they write to them. gc.freeze() keeps the collector from touching, and
+# so copying, the preloaded objects in every worker.
+#
+# Connections must not cross a fork: a socket shared by two processes mixes
+# their protocol streams. The master closes its pooled connections before
+# forking and every worker starts from empty pools.
+#
+# Each worker has its own page cache and in-memory indexes, and a write only
+# invalidates those of the worker that served it. Cached page data is keyed
+# by the version of its rows (see queries.py), so no worker serves a page
+# older than the database it reads, and a client that just wrote reads its
+# write on every worker (see replicas.py). Other workers' writes reach:
+#   - /venues when the venue_area_summary view is refreshed, at the latest
+#     AREA_SUMMARY_DEBOUNCE_SECONDS after the write (see area_summary.py);
+#   - autocomplete and recommendations when the worker rebuilds its index,
+#     at the latest AUTOCOMPLETE_MAX_AGE or RECOMMENDATIONS_MAX_AGE seconds
+#     after the write.
+#
+# Workers are cooperative by default (WEB_WORKER_CLASS=gevent): gevent and
+# psycogreen make every socket wait, including psycopg2 waiting on
+# PostgreSQL, yield to the other requests of the process, so a slow search
+# or listing query no longer holds a thread. One worker per core serves up
+# to WEB_WORKER_CONNECTIONS requests at once; their queries share the
+# worker's connection pool, sized from that number below, and queue on it
+# without blocking the others. Python code between two waits, such as
+# rendering a page, runs one request at a time per worker. The in-memory
+# indexes are rebuilt in a native thread (see indexes.py) rather than a
+# greenlet, so a rebuild does not stall the requests of its worker.
+#
+# WEB_WORKER_CLASS=gthread runs 2 x cores + 1 workers with WEB_THREADS
+# threads each instead. Each worker keeps its own caches and in-memory
+# indexes (see autocomplete.py for the memory they need).
+#
+# The workers write their request and pool metrics to FYYUR_METRICS_DIR, a
+# new temporary directory unless it is set, and /metrics answered by any of
+# them adds them all up (see instrumentation.py).
+
+os.environ.setdefault('FYYUR_DEBUG', 'false')
+# Read by config.py when the app is preloaded.
+if 'FYYUR_METRICS_DIR' not in os.environ:
+    os.environ['FYYUR_METRICS_DIR'] = tempfile.mkdtemp(prefix='fyyur-metrics-')
+
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gevent')
+if worker_class == 'gevent':
+    # Before anything else is imported, so that the app's locks, threads and
+    # sockets are the cooperative ones.
+    from gevent import monkey
+    monkey.patch_all()
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+    default_workers = multiprocessing.cpu_count()
+else:
+    default_workers = multiprocessing.cpu_count() * 2 + 1
+
+wsgi_app = 'wsgi:app'
+bind = os.environ.get('BIND', '0.0.0.0:%s' % os.environ.get('PORT', '8000'))
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', default_workers))
+worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', 100))
+threads = int(os.environ.get('WEB_THREADS', 4))
+if worker_class == 'gevent':
+    # Read by config.py when the app is preloaded. A quarter of the requests
+    # in flight get a pooled connection and as many again an overflow one;
+    # the others wait for one. That is up to workers x 2 x pool size
+    # connections per database, within PostgreSQL's max_connections.
+    pool_size = max(5, worker_connections // 4)
+    os.environ.setdefault('FYYUR_DB_POOL_SIZE', str(pool_size))
+    os.environ.setdefault('FYYUR_DB_MAX_OVERFLOW', str(pool_size))
+# Recycle workers now and then, staggered, to bound the growth of a leak.
+max_requests = 10000
+max_requests_jitter = 1000
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
+
+
+def on_starting(server):
+    from instrumentation import clear_directory
+
+    clear_directory(os.environ['FYYUR_METRICS_DIR'])
+
+
+def when_ready(server):
+    from templating import compile_templates
+
+    count = compile_templates(server.app.wsgi())
+    gc.freeze()
+    server.log.info('Preloaded %d templates', count)
+
+
+def pre_fork(server, worker):
+    from model import db
+
+    db.dispose_engines(server.app.wsgi())
+
+
+def post_fork(server, worker):
+    from model import db
+
+    db.dispose_engines(server.app.wsgi())
+
+
+def worker_exit(server, worker):
+    from instrumentation import write_process_state
+
+    # Also called in the master for a worker that is already gone.
+    if os.getpid() == worker.pid:
+        # The requests since the last write of the worker's metrics.
+        write_process_state(os.environ['FYYUR_METRICS_DIR'])
+
+
+def child_exit(server, worker):
+    from instrumentation import retire_processes
+
+    retire_processes(os.environ['FYYUR_METRICS_DIR'], server.WORKERS)
+
+
+def on_exit(server):
+    from instrumentation import clear_directory
+
+    clear_directory(os.environ['FYYUR_METRICS_DIR'])
+    try:
+        os.rmdir(os.environ['FYYUR_METRICS_DIR'])
+    except OSError:
+        # Not empty: a directory of the operator's choosing.
+        pass
@@ -0,0 +1,319 @@
+import csv
+import io
+import json
+import os
+from datetime import timedelta
+from itertools import islice
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import DateTime, Integer, String, column, func, table
+from sqlalchemy.dialects.postgresql import insert
+from werkzeug.datastructures import MultiDict
+
+import area_summary
+import bookings
+from forms import ArtistForm, ShowForm, VenueForm
+from model import db, Artist, Venue, Show
+
+# ----------------------------------------------------------------------------#
+# Bulk import.
+# ----------------------------------------------------------------------------#
+# Records are streamed from CSV or NDJSON in chunks, validated with the same
+# forms as the create pages, and loaded with one COPY (or executemany) per
+# chunk. The number of input records done is recorded in import_checkpoint
+# in the transaction of each chunk, so an interrupted import resumes right
+# after the last committed chunk and loads no record twice. Shows that would
+# overlap a booking of their venue, already in the database or earlier in the
+# chunk, are rejected before the load: the exclusion constraint on
+# venue_booking would otherwise fail the whole chunk, and every resume with it.
+
+KINDS = {
+    'venues': (Venue, VenueForm),
+    'artists': (Artist, ArtistForm),
+    'shows': (Show, ShowForm),
+}
+
+BOOLEAN_FIELDS = ('seeking_talent', 'seeking_venue')
+FALSE_VALUES = ('', '0', 'false', 'f', 'n', 'no', 'off')
+
+import_checkpoint = table(
+    'import_checkpoint',
+    column('name', String),
+    column('records', Integer),
+    column('updated_at', DateTime),
+)
+
+
+def read_records(path, fmt):
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            for record in csv.DictReader(f):
+                # Multi-valued genres are comma separated inside one cell.
+                if record.get('genres'):
+                    record['genres'] = [genre.strip() for genre
+                                        in record['genres'].split(',')]
+                yield record
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def chunked(records, size):
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def to_formdata(record):
+    formdata = MultiDict()
+    for key, value in record.items():
+        if value is None:
+            continue
+        if isinstance(value, list):
+            formdata.setlist(key, [str(item) for item in value])
+        elif key in BOOLEAN_FIELDS:
+            # An unchecked checkbox is simply absent from a form post.
+            if str(value).strip().lower() not in FALSE_VALUES:
+                formdata[key] = 'y'
+        else:
+            formdata[key] = str(value)
+    return formdata
+
+
+def validate(form_cls, record):
+    form = form_cls(to_formdata(record), meta={'csrf': False})
+    if not form.validate():
+        return None, form.errors
+    row = {name: field.data for name, field in form._fields.items()
+           if name != 'csrf_token'}
+    if record.get('id') not in (None, ''):
+        if not str(record['id']).isdigit():
+            return None, {'id': ['not a valid id']}
+        row['id'] = int(record['id'])
+    return row, None
+
+
+def resolve_foreign_keys(rows, records, errors):
+    """Fill in venue_id/artist_id for shows given by venue/artist name and
+    check that referenced ids exist, with one query per table per chunk."""
+    for model, key, name_key in ((Venue, 'venue_id', 'venue'),
+                                 (Artist, 'artist_id', 'artist')):
+        names = {record[name_key] for row, record in zip(rows, records)
+                 if row is not None and not row[key] and record.get(name_key)}
+        ids_by_name = {}
+        if names:
+            for id, name in db.session.query(model.id, model.name)\
+                    .filter(model.name.in_(names)):
+                ids_by_name.setdefault(name, []).append(id)
+
+        for index, (row, record) in enumerate(zip(rows, records)):
+            if row is None or row[key]:
+                continue
+            matches = ids_by_name.get(record.get(name_key), [])
+            if len(matches) == 1:
+                row[key] = matches[0]
+            else:
+                errors[index] = {name_key: ['%d %s named %r' % (
+                    len(matches), model.__tablename__, record.get(name_key))]}
+                rows[index] = None
+
+        for index, row in enumerate(rows):
+            if row is not None and not str(row[key]).isdigit():
+                errors[index] = {key: ['not a valid id']}
+                rows[index] = None
+
+        ids = {int(row[key]) for row in rows if row is not None}
+        known = {id for id, in db.session.query(model.id)
+                 .filter(model.id.in_(ids))} if ids else set()
+        for index, row in enumerate(rows):
+            if row is not None and int(row[key]) not in known:
+                errors[index] = {key: ['unknown id %s' % row[key]]}
+                rows[index] = None
+
+
+def reject_conflicts(rows, errors):
+    """Reject shows overlapping a booking of their venue: one query for the
+    existing bookings, then a sweep over the chunk's own shows."""
+    slots = []
+    for index, row in enumerate(rows):
+        if row is not None:
+            end_time = row['start_time'] \
+                + timedelta(minutes=row['duration_minutes'])
+            slots.append((index, int(row['venue_id']), row['start_time'],
+                          end_time))
+
+    booked = bookings.conflicts([slot[1:] for slot in slots])
+    for position, (busy_from, busy_until) in booked.items():
+        index = slots[position][0]
+        errors[index] = {'start_time': ['the venue is already booked from %s '
+                                        'to %s' % (busy_from, busy_until)]}
+        rows[index] = None
+
+    # Of the chunk's shows overlapping at one venue, the earliest is kept.
+    kept_until = {}
+    for index, venue_id, start_time, end_time in sorted(
+            (slot for slot in slots if rows[slot[0]] is not None),
+            key=lambda slot: (slot[1], slot[2], slot[0])):
+        if venue_id in kept_until and start_time < kept_until[venue_id]:
+            errors[index] = {'start_time': ['the venue is already booked until '
+                                            '%s by another record'
+                                            % kept_until[venue_id]]}
+            rows[index] = None
+        else:
+            kept_until[venue_id] = end_time
+
+
+def copy_value(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, list):
+        return '{%s}' % ','.join(
+            '"%s"' % str(item).replace('\\', '\\\\').replace('"', '\\"')
+            for item in value)
+    return value
+
+
+def load_copy(model, columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([copy_value(row[column]) for column in columns])
+    buffer.seek(0)
+
+    statement = 'COPY "%s" (%s) FROM STDIN WITH (FORMAT csv)' % (
+        model.__tablename__, ', '.join('"%s"' % column for column in columns))
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(statement, buffer)
+    finally:
+        cursor.close()
+
+
+def load_executemany(model, columns, rows):
+    db.session.execute(model.__table__.insert(),
+                       [{column: row[column] for column in columns}
+                        for row in rows])
+
+
+def load(model, rows, method):
+    # Rows with and without an explicit id are loaded as separate batches.
+    batches = {}
+    for row in rows:
+        batches.setdefault(tuple(sorted(row)), []).append(row)
+    for columns, batch in batches.items():
+        if method == 'copy':
+            load_copy(model, columns, batch)
+        else:
+            load_executemany(model, columns, batch)
+
+
+def read_checkpoint(name):
+    return db.session.query(import_checkpoint.c.records)\
+        .filter(import_checkpoint.c.name == name).scalar() or 0
+
+
+def write_checkpoint(name, records):
+    # Part of the chunk's transaction: committed with its rows or not at all.
+    statement = insert(import_checkpoint).values(name=name, records=records)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[import_checkpoint.c.name],
+        set_={'records': statement.excluded.records,
+              'updated_at': func.now()}))
+
+
+def clear_checkpoint(name):
+    db.session.execute(import_checkpoint.delete()
+                       .where(import_checkpoint.c.name == name))
+
+
+def reset_sequence(model):
+    # The next id is max(id) + 1, or 1 on an empty table.
+    db.session.execute(
+        "SELECT setval(pg_get_serial_sequence('\"%s\"', 'id'), "
+        "coalesce(max(id), 0) + 1, false) FROM \"%s\""
+        % (model.__tablename__, model.__tablename__))
+
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']),
+              help='Input format; guessed from the file extension by default.')
+@click.option('--chunk-size', default=5000, show_default=True,
+              help='Records validated and committed per transaction.')
+@click.option('--method', type=click.Choice(['copy', 'executemany']),
+              default='copy', show_default=True)
+@click.option('--checkpoint',
+              help='Name the progress is recorded under; defaults to the '
+                   'absolute path of PATH.')
+@click.option('--rejects', type=click.Path(dir_okay=False),
+              help='Write invalid records and their errors to this NDJSON file.')
+@with_appcontext
+def import_command(kind, path, fmt, chunk_size, method, checkpoint, rejects):
+    """Bulk load venues, artists or shows from a CSV or NDJSON file."""
+    model, form_cls = KINDS[kind]
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+    checkpoint = checkpoint or os.path.abspath(path)
+
+    done = read_checkpoint(checkpoint)
+    if done:
+        click.echo('Resuming after %d records' % done)
+    records = islice(read_records(path, fmt), done, None)
+    rejects_file = open(rejects, 'a') if rejects else None
+
+    loaded = rejected = 0
+    explicit_ids = False
+    try:
+        for chunk in chunked(records, chunk_size):
+            rows, errors = [], {}
+            for index, record in enumerate(chunk):
+                row, row_errors = validate(form_cls, record)
+                rows.append(row)
+                if row_errors:
+                    errors[index] = row_errors
+            if model is Show:
+                resolve_foreign_keys(rows, chunk, errors)
+                reject_conflicts(rows, errors)
+
+            valid = [row for row in rows if row is not None]
+            explicit_ids = explicit_ids or any('id' in row for row in valid)
+            if valid:
+                load(model, valid, method)
+            done += len(chunk)
+            write_checkpoint(checkpoint, done)
+            db.session.commit()
+
+            loaded += len(valid)
+            rejected += len(errors)
+            for index in sorted(errors):
+                if rejects_file:
+                    rejects_file.write(json.dumps({
+                        'record': done - len(chunk) + index + 1,
+                        'errors': errors[index],
+                        'data': chunk[index]}) + '\n')
+            click.echo('%d records read, %d loaded, %d rejected'
+                       % (done, loaded, rejected))
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if rejects_file:
+            rejects_file.close()
+
+    # Explicit ids bypass the id sequence; move it past them.
+    if explicit_ids:
+        reset_sequence(model)
+    clear_checkpoint(checkpoint)
+    db.session.commit()
+    # Nothing to invalidate: this process shares no cache with the workers,
+    # and the pages listing the imported rows are keyed by versions that the
+    # import changed (see queries.py); /venues by the refresh of its view.
+    if model is not Artist:
+        area_summary.refresh()
@@ -0,0 +1,127 @@
+import sys
+import threading
+import time
+
+from flask import current_app
+
+from model import db
+
+# ----------------------------------------------------------------------------#
+# In-memory indexes.
+# ----------------------------------------------------------------------------#
+# Base for the per-process indexes built from the database (autocomplete.py,
+# recommendations.py). The index is built in a background thread when a
+# worker process serves its first request; until it is ready, lookups get
+# None. The write handlers update it in place, and it is rebuilt in the
+# background once older than the max_age_setting config value, which brings
+# in the writes served by other workers. Entities changed while a rebuild
+# reads the database are re-read and applied to the new indexes before they
+# replace the old ones, so no write of this worker is lost in the swap.
+#
+# Building is CPU-bound for seconds at a million names. In a gevent worker
+# threading.Thread starts a greenlet, which would hold the worker's hub, and
+# every request it serves, until the build is done; there the build runs in
+# a thread of gevent's native pool instead, next to the hub like any other
+# thread. Its queries wait on that thread's own hub.
+
+
+class BackgroundIndex(object):
+
+    # Extension name, also used in log messages.
+    name = None
+    max_age_setting = None
+
+    def __init__(self, app=None):
+        self.app = None
+        self.indexes = None
+        self.built_at = None
+        self.lock = threading.Lock()
+        self.rebuilding = False
+        # (kind, id) of the entities changed during a build, None otherwise
+        self.changes = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.before_first_request(self.rebuild_in_background)
+        app.extensions[self.name] = self
+
+    def load(self):
+        """Read the database and return the new indexes."""
+        raise NotImplementedError
+
+    def fetch(self, kind, id):
+        """Read what the indexes hold of one entity, or None if it is gone."""
+        raise NotImplementedError
+
+    def apply(self, indexes, kind, id, row):
+        """Replace one entity in indexes by row, as returned by fetch()."""
+        raise NotImplementedError
+
+    def build(self):
+        started = time.monotonic()
+        with self.lock:
+            self.changes = set()
+        try:
+            indexes = self.load()
+            while True:
+                with self.lock:
+                    changes, self.changes = self.changes, set()
+                    if not changes:
+                        self.indexes = indexes
+                        self.built_at = started
+                        return
+                for kind, id in changes:
+                    self.apply(indexes, kind, id, self.fetch(kind, id))
+        finally:
+            with self.lock:
+                self.changes = None
+
+    def rebuild_in_background(self):
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+
+        def run():
+            try:
+                with self.app.app_context():
+                    try:
+                        self.build()
+                    finally:
+                        db.session.remove()
+            except Exception:
+                self.app.logger.exception('Building the %s index failed', self.name)
+            finally:
+                self.rebuilding = False
+
+        # gevent is only imported here when it has patched the process.
+        monkey = sys.modules.get('gevent.monkey')
+        if monkey is not None and monkey.is_module_patched('threading'):
+            import gevent
+            gevent.get_hub().threadpool.spawn(run)
+        else:
+            thread = threading.Thread(target=run, daemon=True)
+            thread.start()
+
+    def changed(self, kind, id):
+        """Refresh one entity (kind is 'venue' or 'artist') after a write."""
+        if self.indexes is None and self.changes is None:
+            return
+        row = self.fetch(kind, id)
+        with self.lock:
+            if self.changes is not None:
+                self.changes.add((kind, int(id)))
+            if self.indexes is not None:
+                self.apply(self.indexes, kind, int(id), row)
+
+    def current(self):
+        """The indexes, or None before the first build; starts a rebuild when
+        they are too old. They are read and updated under self.lock."""
+        if self.indexes is None:
+            return None
+        if time.monotonic() - self.built_at \
+                > current_app.config[self.max_age_setting]:
+            self.rebuild_in_background()
+        return self.indexes
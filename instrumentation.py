@@ -0,0 +1,475 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from flask import (Response, before_render_template, current_app, g,
+                   has_request_context, request, template_rendered)
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from model import db
+
+# ----------------------------------------------------------------------------#
+# Request instrumentation.
+# ----------------------------------------------------------------------------#
+# Engine events time every statement and template signals time rendering;
+# both are attributed to the current request through flask.g. At the end of a
+# request the totals go into per-endpoint histograms, served in Prometheus
+# text format at /metrics, and a request that ran the same statement shape
+# N_PLUS_ONE_THRESHOLD times or more is logged as a likely N+1.
+# Bookkeeping is a few perf_counter() calls and a dict update per statement.
+# Connections come from a QueuePool subclass that also times how long each
+# checkout waited, so pool exhaustion shows up separately from slow SQL.
+#
+# The aggregates live in the memory of each process. With METRICS_DIR set,
+# as gunicorn.conf.py does, every worker also writes them to a file of its
+# own in that directory every METRICS_FLUSH_SECONDS, and /metrics, whichever
+# worker answers it, adds up the files of all the workers. The master merges
+# the files of exited workers into retired.json (minus their pool gauges),
+# so the counters do not go back when workers are recycled.
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                    1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+WHITESPACE = re.compile(r'\s+')
+RETIRED = 'retired.json'
+
+
+class RequestStats(object):
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.pool_wait = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement = None
+        self.shapes = Counter()
+        self.render_started = []
+
+    def record_query(self, statement, elapsed):
+        self.query_count += 1
+        self.sql_time += elapsed
+        self.shapes[statement] += 1
+        if elapsed > self.slowest_time:
+            self.slowest_time = elapsed
+            self.slowest_statement = statement
+
+    def repeated_shapes(self, threshold):
+        return [(WHITESPACE.sub(' ', statement).strip(), count)
+                for statement, count in self.shapes.items()
+                if count >= threshold]
+
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def state(self):
+        return {'buckets': list(self.buckets), 'counts': list(self.counts),
+                'sum': self.sum, 'count': self.count}
+
+
+class Metrics(object):
+    """Per-endpoint aggregates for this process."""
+
+    HISTOGRAMS = [
+        ('fyyur_request_duration_seconds', 'Request handling time.',
+         DURATION_BUCKETS),
+        ('fyyur_request_sql_seconds', 'Time spent in SQL per request.',
+         DURATION_BUCKETS),
+        ('fyyur_request_render_seconds', 'Time spent rendering templates per request.',
+         DURATION_BUCKETS),
+        ('fyyur_request_queries', 'SQL statements executed per request.',
+         COUNT_BUCKETS),
+    ]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {name: {} for name, _, _ in self.HISTOGRAMS}
+        self.n_plus_one = Counter()
+        self.pool_checkout = Histogram(DURATION_BUCKETS)
+        self.pool_timeouts = 0
+
+    def observe(self, endpoint, stats, duration):
+        values = {
+            'fyyur_request_duration_seconds': duration,
+            'fyyur_request_sql_seconds': stats.sql_time,
+            'fyyur_request_render_seconds': stats.render_time,
+            'fyyur_request_queries': stats.query_count,
+        }
+        with self.lock:
+            for name, _, buckets in self.HISTOGRAMS:
+                histogram = self.histograms[name].get(endpoint)
+                if histogram is None:
+                    histogram = self.histograms[name][endpoint] = Histogram(buckets)
+                histogram.observe(values[name])
+
+    def flag_n_plus_one(self, endpoint):
+        with self.lock:
+            self.n_plus_one[endpoint] += 1
+
+    def observe_checkout(self, waited, timed_out=False):
+        with self.lock:
+            self.pool_checkout.observe(waited)
+            if timed_out:
+                self.pool_timeouts += 1
+
+    def state(self, pool=None):
+        """The aggregates of this process, and the gauges of its pool, as a
+        JSON-serializable dict."""
+        with self.lock:
+            state = {
+                'processes': 1,
+                'histograms': {
+                    name: {endpoint: histogram.state() for endpoint, histogram
+                           in self.histograms[name].items()}
+                    for name, _, _ in self.HISTOGRAMS},
+                'n_plus_one': dict(self.n_plus_one),
+                'pool_checkout': self.pool_checkout.state(),
+                'pool_timeouts': self.pool_timeouts,
+                'pool': {},
+            }
+        if isinstance(pool, QueuePool):
+            state['pool'] = {'fyyur_db_pool_size': pool.size(),
+                             'fyyur_db_pool_checked_out': pool.checkedout(),
+                             'fyyur_db_pool_overflow': pool.overflow()}
+        return state
+
+    def render(self, pool=None):
+        return render_state(self.state(pool))
+
+
+POOL_GAUGES = [
+    ('fyyur_db_pool_size', 'Configured pool size.'),
+    ('fyyur_db_pool_checked_out', 'Connections in use.'),
+    ('fyyur_db_pool_overflow', 'Connections opened beyond the pool size.'),
+]
+
+
+def add_histograms(total, histogram):
+    if total is None:
+        return dict(histogram, counts=list(histogram['counts']))
+    total['counts'] = [a + b for a, b in zip(total['counts'],
+                                             histogram['counts'])]
+    total['sum'] += histogram['sum']
+    total['count'] += histogram['count']
+    return total
+
+
+def merge_states(states):
+    """Add up the states of several processes: counters and histograms are
+    summed per endpoint, and so are the pool gauges."""
+    merged = {'processes': 0,
+              'histograms': {name: {} for name, _, _ in Metrics.HISTOGRAMS},
+              'n_plus_one': Counter(),
+              'pool_checkout': Histogram(DURATION_BUCKETS).state(),
+              'pool_timeouts': 0,
+              'pool': Counter()}
+    for state in states:
+        merged['processes'] += state['processes']
+        for name, endpoints in state['histograms'].items():
+            histograms = merged['histograms'].setdefault(name, {})
+            for endpoint, histogram in endpoints.items():
+                histograms[endpoint] = add_histograms(histograms.get(endpoint),
+                                                      histogram)
+        merged['n_plus_one'].update(state['n_plus_one'])
+        add_histograms(merged['pool_checkout'], state['pool_checkout'])
+        merged['pool_timeouts'] += state['pool_timeouts']
+        merged['pool'].update(state['pool'])
+    return merged
+
+
+def render_state(state):
+    lines = []
+    for name, help, _ in Metrics.HISTOGRAMS:
+        lines.append('# HELP %s %s' % (name, help))
+        lines.append('# TYPE %s histogram' % name)
+        for endpoint, histogram in sorted(state['histograms'][name].items()):
+            cumulative = 0
+            for bound, count in zip(histogram['buckets'], histogram['counts']):
+                cumulative += count
+                lines.append('%s_bucket{endpoint="%s",le="%s"} %d'
+                             % (name, endpoint, bound, cumulative))
+            lines.append('%s_bucket{endpoint="%s",le="+Inf"} %d'
+                         % (name, endpoint, histogram['count']))
+            lines.append('%s_sum{endpoint="%s"} %f'
+                         % (name, endpoint, histogram['sum']))
+            lines.append('%s_count{endpoint="%s"} %d'
+                         % (name, endpoint, histogram['count']))
+    lines.append('# HELP fyyur_n_plus_one_total Requests flagged as N+1.')
+    lines.append('# TYPE fyyur_n_plus_one_total counter')
+    for endpoint, count in sorted(state['n_plus_one'].items()):
+        lines.append('fyyur_n_plus_one_total{endpoint="%s"} %d'
+                     % (endpoint, count))
+
+    histogram = state['pool_checkout']
+    lines.append('# HELP fyyur_db_pool_checkout_seconds Time waited '
+                 'for a pooled connection.')
+    lines.append('# TYPE fyyur_db_pool_checkout_seconds histogram')
+    cumulative = 0
+    for bound, count in zip(histogram['buckets'], histogram['counts']):
+        cumulative += count
+        lines.append('fyyur_db_pool_checkout_seconds_bucket{le="%s"} %d'
+                     % (bound, cumulative))
+    lines.append('fyyur_db_pool_checkout_seconds_bucket{le="+Inf"} %d'
+                 % histogram['count'])
+    lines.append('fyyur_db_pool_checkout_seconds_sum %f' % histogram['sum'])
+    lines.append('fyyur_db_pool_checkout_seconds_count %d' % histogram['count'])
+    lines.append('# HELP fyyur_db_pool_timeouts_total Checkouts that '
+                 'gave up waiting for a connection.')
+    lines.append('# TYPE fyyur_db_pool_timeouts_total counter')
+    lines.append('fyyur_db_pool_timeouts_total %d' % state['pool_timeouts'])
+
+    if state['pool']:
+        for name, help in POOL_GAUGES:
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s gauge' % name)
+            lines.append('%s %d' % (name, state['pool'].get(name, 0)))
+    lines.append('# HELP fyyur_metrics_processes Worker processes whose '
+                 'metrics are added up.')
+    lines.append('# TYPE fyyur_metrics_processes gauge')
+    lines.append('fyyur_metrics_processes %d' % state['processes'])
+    return '\n'.join(lines) + '\n'
+
+
+def write_state(directory, name, state):
+    # The file is replaced whole: a reader never sees it half written.
+    path = os.path.join(directory, name)
+    temporary = '%s.%d.tmp' % (path, threading.get_ident())
+    with open(temporary, 'w') as f:
+        json.dump(state, f)
+    os.replace(temporary, path)
+
+
+def write_process_state(directory, pool=None):
+    write_state(directory, '%d.json' % os.getpid(), metrics.state(pool))
+
+
+def read_states(directory):
+    states = []
+    for name in os.listdir(directory):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                states.append(json.load(f))
+        except (OSError, ValueError):
+            # Retired since the listing.
+            continue
+    return states
+
+
+def retire_processes(directory, live_pids):
+    """Merge the states of the workers not in live_pids into the retired
+    state. Run by the gunicorn master, its only writer, when a worker exits:
+    a worker killed during a reload may exit without a hook of its own."""
+    retired, paths = [], []
+    for name in os.listdir(directory):
+        pid, _, extension = name.partition('.')
+        if extension != 'json' or not pid.isdigit() or int(pid) in live_pids:
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            continue
+        # Its connections are closed: only the counters remain.
+        state['processes'] = 0
+        state['pool'] = {}
+        retired.append(state)
+        paths.append(path)
+    if not retired:
+        return
+    try:
+        with open(os.path.join(directory, RETIRED)) as f:
+            retired.append(json.load(f))
+    except (OSError, ValueError):
+        pass
+    write_state(directory, RETIRED, merge_states(retired))
+    for path in paths:
+        os.remove(path)
+
+
+def clear_directory(directory):
+    """Remove the states of a previous server run."""
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith(('.json', '.tmp')):
+            os.remove(os.path.join(directory, name))
+
+
+flusher_pid = None
+flusher_lock = threading.Lock()
+
+
+def start_flusher(directory, interval, engine):
+    """Write the state of this process to directory every interval seconds,
+    once per process: threads do not survive the fork of a worker."""
+    global flusher_pid
+    with flusher_lock:
+        if flusher_pid == os.getpid():
+            return
+        flusher_pid = os.getpid()
+
+    def flush():
+        while True:
+            time.sleep(interval)
+            # engine.pool is replaced when the engine is disposed.
+            write_process_state(directory, engine.pool)
+
+    threading.Thread(target=flush, name='metrics-flusher', daemon=True).start()
+
+
+metrics = Metrics()
+
+
+class TimedQueuePool(QueuePool):
+
+    _checkout = threading.local()
+
+    def _do_get(self):
+        # QueuePool._do_get() may call itself; only time the outermost call.
+        if getattr(self._checkout, 'active', False):
+            return super(TimedQueuePool, self)._do_get()
+        self._checkout.active = True
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super(TimedQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self._checkout.active = False
+            waited = time.perf_counter() - started
+            metrics.observe_checkout(waited, timed_out)
+            stats = current_stats()
+            if stats is not None:
+                stats.pool_wait += waited
+
+
+def current_stats():
+    if has_request_context():
+        return g.get('request_stats')
+    return None
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    stats = current_stats()
+    if stats is not None:
+        stats.record_query(statement, elapsed)
+
+
+def handle_error(exception_context):
+    started = exception_context.connection.info.get('query_started') \
+        if exception_context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def on_before_render(app, template, context):
+    stats = current_stats()
+    if stats is not None:
+        stats.render_started.append(time.perf_counter())
+
+
+def on_rendered(app, template, context):
+    stats = current_stats()
+    if stats is not None and stats.render_started:
+        started = stats.render_started.pop()
+        # Only the outermost render counts, nested renders are part of it.
+        if not stats.render_started:
+            stats.render_time += time.perf_counter() - started
+
+
+def start_request():
+    g.request_stats = RequestStats()
+    directory = current_app.config['METRICS_DIR']
+    if directory and flusher_pid != os.getpid():
+        start_flusher(directory, current_app.config['METRICS_FLUSH_SECONDS'],
+                      db.engine)
+
+
+def finish_request(response):
+    stats = g.pop('request_stats', None)
+    if stats is None:
+        return response
+    duration = time.perf_counter() - stats.started
+    endpoint = request.endpoint or 'unmatched'
+    metrics.observe(endpoint, stats, duration)
+
+    config = current_app.config
+    repeated = stats.repeated_shapes(config['N_PLUS_ONE_THRESHOLD'])
+    if repeated:
+        metrics.flag_n_plus_one(endpoint)
+        for statement, count in repeated:
+            current_app.logger.warning('Possible N+1 in %s: %d x %s',
+                                       endpoint, count, statement)
+    if stats.slowest_time >= config['SLOW_QUERY_SECONDS']:
+        current_app.logger.warning('Slow query in %s (%.3fs): %s', endpoint,
+                                   stats.slowest_time,
+                                   WHITESPACE.sub(' ', stats.slowest_statement))
+
+    response.headers.add('Server-Timing',
+                         'pool;dur=%.1f, sql;dur=%.1f;desc="%d queries", '
+                         'render;dur=%.1f, total;dur=%.1f' % (
+                             stats.pool_wait * 1000, stats.sql_time * 1000,
+                             stats.query_count, stats.render_time * 1000,
+                             duration * 1000))
+    return response
+
+
+def metrics_view():
+    directory = current_app.config['METRICS_DIR']
+    if not directory:
+        body = metrics.render(db.engine.pool)
+    else:
+        # This process's state is written first, so that it is current.
+        write_process_state(directory, db.engine.pool)
+        body = render_state(merge_states(read_states(directory)))
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    if not app.config['INSTRUMENTATION_ENABLED']:
+        return
+    # A copy: the dict of the config module is shared by every app built.
+    engine_options = app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(
+        app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    engine_options.setdefault('poolclass', TimedQueuePool)
+    if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(Engine, 'handle_error', handle_error)
+    before_render_template.connect(on_before_render, app)
+    template_rendered.connect(on_rendered, app)
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
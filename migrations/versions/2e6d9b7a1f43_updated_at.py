@@ -0,0 +1,30 @@
+"""updated_at
+
+Revision ID: 2e6d9b7a1f43
+Revises: c71a3e5f8d20
+Create Date: 2024-01-22 16:25:08.730541
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2e6d9b7a1f43'
+down_revision = 'c71a3e5f8d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # now() is evaluated once per statement, so existing rows all get the
+    # migration time and the table is not rewritten.
+    for table in ('Artist', 'Venue', 'Show'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(),
+                                       server_default=sa.func.now(),
+                                       nullable=False))
+
+
+def downgrade():
+    for table in ('Show', 'Venue', 'Artist'):
+        op.drop_column(table, 'updated_at')
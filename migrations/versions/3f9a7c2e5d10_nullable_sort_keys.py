@@ -0,0 +1,44 @@
+"""nullable sort keys
+
+Revision ID: 3f9a7c2e5d10
+Revises: d2a8f5c1e7b3
+Create Date: 2024-03-04 10:12:36.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a7c2e5d10'
+down_revision = 'd2a8f5c1e7b3'
+branch_labels = None
+depends_on = None
+
+# The listings sort nullable names, cities and states as coalesce(key, '')
+# (see pagination.py); the keyset indexes are rebuilt on those expressions.
+INDEXES = [
+    ('ix_Artist_name_id', 'Artist', ['name', 'id'],
+     [sa.text("coalesce(name, '')"), 'id']),
+    ('ix_venue_area_summary_area', 'venue_area_summary',
+     ['state', 'city', 'name', 'venue_id'],
+     [sa.text("coalesce(state, '')"), sa.text("coalesce(city, '')"),
+      sa.text("coalesce(name, '')"), 'venue_id']),
+]
+
+
+def replace_indexes(position):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+    with op.get_context().autocommit_block():
+        for name, table, *columns in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
+            op.create_index(name, table, columns[position],
+                            postgresql_concurrently=True)
+
+
+def upgrade():
+    replace_indexes(1)
+
+
+def downgrade():
+    replace_indexes(0)
@@ -0,0 +1,50 @@
+"""search indexes
+
+Revision ID: 5b8e0c2d4a17
+Revises: e3134c85a185
+Create Date: 2024-01-08 19:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e0c2d4a17'
+down_revision = 'e3134c85a185'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # array_to_string() is only STABLE, so the document is built by a wrapper
+    # declared IMMUTABLE to make it usable in index expressions.
+    op.execute("""
+        CREATE FUNCTION fyyur_search_document(name text, city text,
+                                              state text, genres text[])
+        RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        AS $$
+            SELECT lower(coalesce(name, '') || ' ' || coalesce(city, '') || ' '
+                         || coalesce(state, '') || ' '
+                         || coalesce(array_to_string(genres, ' '), ''))
+        $$
+    """)
+    for table in ('Venue', 'Artist'):
+        op.execute(f"""
+            CREATE INDEX "ix_{table}_search_tsv" ON "{table}" USING gin
+            (to_tsvector('simple'::regconfig,
+                         fyyur_search_document(name, city, state, genres)))
+        """)
+        op.execute(f"""
+            CREATE INDEX "ix_{table}_search_trgm" ON "{table}" USING gin
+            (fyyur_search_document(name, city, state, genres) gin_trgm_ops)
+        """)
+
+
+def downgrade():
+    for table in ('Venue', 'Artist'):
+        op.execute(f'DROP INDEX "ix_{table}_search_trgm"')
+        op.execute(f'DROP INDEX "ix_{table}_search_tsv"')
+    op.execute('DROP FUNCTION fyyur_search_document(text, text, text, text[])')
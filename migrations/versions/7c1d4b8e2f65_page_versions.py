@@ -0,0 +1,122 @@
+"""page versions
+
+Revision ID: 7c1d4b8e2f65
+Revises: 3f9a7c2e5d10
+Create Date: 2024-03-11 14:27:05.913846
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1d4b8e2f65'
+down_revision = '3f9a7c2e5d10'
+branch_labels = None
+depends_on = None
+
+# "Venue".version and "Artist".version count the changes to the page and
+# calendar feed of a venue or an artist, so that a cached page is checked
+# with one primary key lookup (see queries.py). A version is bumped by any
+# update of its row, by every statement changing the shows of the venue or
+# artist, and by changes to what their pages show of the other side: the
+# name and image of artists, the name, image and location of venues.
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('version', sa.Integer(),
+                                       server_default='0', nullable=False))
+
+    op.execute("""
+        CREATE FUNCTION fyyur_bump_version() RETURNS trigger AS $$
+        BEGIN
+            NEW.version := OLD.version + 1;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    for table in ('Venue', 'Artist'):
+        op.execute('CREATE TRIGGER "%s_version" BEFORE UPDATE ON "%s" '
+                   'FOR EACH ROW EXECUTE PROCEDURE fyyur_bump_version()'
+                   % (table, table))
+
+    # Transition tables are only available to triggers on one event.
+    op.execute("""
+        CREATE FUNCTION fyyur_bump_show_versions() RETURNS trigger AS $$
+        BEGIN
+            IF current_setting('fyyur.moving_partition', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE "Venue" SET version = version + 1
+                WHERE id IN (SELECT venue_id FROM new_shows);
+                UPDATE "Artist" SET version = version + 1
+                WHERE id IN (SELECT artist_id FROM new_shows);
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE "Venue" SET version = version + 1
+                WHERE id IN (SELECT venue_id FROM old_shows);
+                UPDATE "Artist" SET version = version + 1
+                WHERE id IN (SELECT artist_id FROM old_shows);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    for event, tables in (('INSERT', 'NEW TABLE AS new_shows'),
+                          ('UPDATE', 'OLD TABLE AS old_shows '
+                                     'NEW TABLE AS new_shows'),
+                          ('DELETE', 'OLD TABLE AS old_shows')):
+        op.execute('CREATE TRIGGER show_%s_versions AFTER %s ON "Show" '
+                   'REFERENCING %s FOR EACH STATEMENT '
+                   'EXECUTE PROCEDURE fyyur_bump_show_versions()'
+                   % (event.lower(), event, tables))
+
+    op.execute("""
+        CREATE FUNCTION fyyur_bump_counterpart_versions() RETURNS trigger AS $$
+        BEGIN
+            IF TG_TABLE_NAME = 'Venue' THEN
+                UPDATE "Artist" SET version = version + 1
+                WHERE id IN (SELECT artist_id FROM "Show"
+                             WHERE venue_id = NEW.id);
+            ELSE
+                UPDATE "Venue" SET version = version + 1
+                WHERE id IN (SELECT venue_id FROM "Show"
+                             WHERE artist_id = NEW.id);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER "Venue_counterpart_versions"
+        AFTER UPDATE OF name, image_link, address, city, state ON "Venue"
+        FOR EACH ROW
+        WHEN ((OLD.name, OLD.image_link, OLD.address, OLD.city, OLD.state)
+              IS DISTINCT FROM
+              (NEW.name, NEW.image_link, NEW.address, NEW.city, NEW.state))
+        EXECUTE PROCEDURE fyyur_bump_counterpart_versions()
+    """)
+    op.execute("""
+        CREATE TRIGGER "Artist_counterpart_versions"
+        AFTER UPDATE OF name, image_link ON "Artist"
+        FOR EACH ROW
+        WHEN ((OLD.name, OLD.image_link) IS DISTINCT FROM
+              (NEW.name, NEW.image_link))
+        EXECUTE PROCEDURE fyyur_bump_counterpart_versions()
+    """)
+
+
+def downgrade():
+    for table in ('Venue', 'Artist'):
+        op.execute('DROP TRIGGER "%s_counterpart_versions" ON "%s"'
+                   % (table, table))
+    op.execute('DROP FUNCTION fyyur_bump_counterpart_versions()')
+    for event in ('insert', 'update', 'delete'):
+        op.execute('DROP TRIGGER show_%s_versions ON "Show"' % event)
+    op.execute('DROP FUNCTION fyyur_bump_show_versions()')
+    for table in ('Venue', 'Artist'):
+        op.execute('DROP TRIGGER "%s_version" ON "%s"' % (table, table))
+        op.drop_column(table, 'version')
+    op.execute('DROP FUNCTION fyyur_bump_version()')
@@ -0,0 +1,50 @@
+"""venue area summary
+
+Revision ID: 8a0f3c6e2b94
+Revises: 2e6d9b7a1f43
+Create Date: 2024-02-05 11:17:43.902815
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a0f3c6e2b94'
+down_revision = '2e6d9b7a1f43'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE MATERIALIZED VIEW venue_area_summary AS
+        SELECT "Venue".id AS venue_id,
+               "Venue".city,
+               "Venue".state,
+               "Venue".name,
+               count("Show".id) FILTER (WHERE "Show".start_time > now())
+                   AS num_upcoming_shows,
+               min("Show".start_time) FILTER (WHERE "Show".start_time > now())
+                   AS next_show
+        FROM "Venue" LEFT OUTER JOIN "Show" ON "Show".venue_id = "Venue".id
+        GROUP BY "Venue".id
+    """)
+    # REFRESH ... CONCURRENTLY requires a unique index on plain columns.
+    op.create_index('ix_venue_area_summary_venue_id', 'venue_area_summary',
+                    ['venue_id'], unique=True)
+    op.create_index('ix_venue_area_summary_area', 'venue_area_summary',
+                    ['state', 'city', 'name', 'venue_id'])
+    op.create_table('materialized_view_refresh',
+    sa.Column('view_name', sa.String(), nullable=False),
+    sa.Column('refreshed_at', sa.DateTime(), server_default=sa.func.now(),
+              nullable=False),
+    sa.PrimaryKeyConstraint('view_name')
+    )
+    op.execute("INSERT INTO materialized_view_refresh (view_name) "
+               "VALUES ('venue_area_summary')")
+
+
+def downgrade():
+    op.drop_table('materialized_view_refresh')
+    op.execute('DROP MATERIALIZED VIEW venue_area_summary')
@@ -0,0 +1,37 @@
+"""keyset pagination indexes
+
+Revision ID: 9d4e61f0b2c3
+Revises: 5b8e0c2d4a17
+Create Date: 2024-01-15 18:03:27.540912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4e61f0b2c3'
+down_revision = '5b8e0c2d4a17'
+branch_labels = None
+depends_on = None
+
+# Each index matches the sort key of a paginated listing, so that
+# "WHERE (key) > (cursor) ORDER BY key LIMIT n" is a bounded range scan.
+INDEXES = [
+    ('ix_Show_start_time_id', 'Show', ['start_time', 'id']),
+    ('ix_Artist_name_id', 'Artist', ['name', 'id']),
+    ('ix_Venue_state_city_name_id', 'Venue', ['state', 'city', 'name', 'id']),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,31 @@
+"""import checkpoint
+
+Revision ID: a4e8b2f7c931
+Revises: 7c1d4b8e2f65
+Create Date: 2024-03-18 09:44:21.306518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4e8b2f7c931'
+down_revision = '7c1d4b8e2f65'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Progress of 'flask import', committed with each chunk (see importer.py).
+    op.create_table('import_checkpoint',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('records', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(),
+              nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('import_checkpoint')
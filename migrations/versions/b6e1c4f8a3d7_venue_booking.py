@@ -0,0 +1,88 @@
+"""venue booking
+
+Revision ID: b6e1c4f8a3d7
+Revises: f4b7d2a9c6e1
+Create Date: 2024-02-19 09:36:41.218573
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e1c4f8a3d7'
+down_revision = 'f4b7d2a9c6e1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('duration_minutes', sa.Integer(),
+                                    server_default='120', nullable=False))
+    op.create_check_constraint('ck_Show_duration_minutes', 'Show',
+                               'duration_minutes > 0')
+
+    # Exclusion constraints are not supported on partitioned tables, so the
+    # time each show occupies its venue is kept in venue_booking by a trigger
+    # on "Show". The constraint's GiST index on (venue_id, during), with
+    # btree_gist for the integer, also serves the free/busy queries.
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.create_table('venue_booking',
+    sa.Column('show_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('during', postgresql.TSRANGE(), nullable=False),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ),
+    sa.PrimaryKeyConstraint('show_id'),
+    postgresql.ExcludeConstraint(('venue_id', '='), ('during', '&&'),
+                                 name='venue_booking_no_overlap',
+                                 using='gist')
+    )
+
+    # Partition maintenance moves rows between partitions of "Show" with
+    # fyyur.moving_partition set; the bookings stay as they are.
+    op.execute("""
+        CREATE FUNCTION fyyur_sync_venue_booking() RETURNS trigger AS $$
+        BEGIN
+            IF current_setting('fyyur.moving_partition', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM venue_booking WHERE show_id = OLD.id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO venue_booking (show_id, venue_id, during)
+                VALUES (NEW.id, NEW.venue_id,
+                        tsrange(NEW.start_time, NEW.start_time
+                                + make_interval(mins => NEW.duration_minutes)));
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+
+    # Shows that overlap an earlier show at the same venue are left without
+    # a booking rather than failing the migration; they keep being listed.
+    op.execute("""
+        INSERT INTO venue_booking (show_id, venue_id, during)
+        SELECT id, venue_id,
+               tsrange(start_time, start_time
+                       + make_interval(mins => duration_minutes))
+        FROM "Show"
+        ORDER BY start_time, id
+        ON CONFLICT DO NOTHING
+    """)
+    op.execute("""
+        CREATE TRIGGER show_venue_booking
+        AFTER INSERT OR UPDATE OF venue_id, start_time, duration_minutes
+            OR DELETE ON "Show"
+        FOR EACH ROW EXECUTE PROCEDURE fyyur_sync_venue_booking()
+    """)
+
+
+def downgrade():
+    op.execute('DROP TRIGGER show_venue_booking ON "Show"')
+    op.execute('DROP FUNCTION fyyur_sync_venue_booking()')
+    op.drop_table('venue_booking')
+    op.drop_constraint('ck_Show_duration_minutes', 'Show')
+    op.drop_column('Show', 'duration_minutes')
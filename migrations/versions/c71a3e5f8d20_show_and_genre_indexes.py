@@ -0,0 +1,40 @@
+"""show and genre indexes
+
+Revision ID: c71a3e5f8d20
+Revises: 9d4e61f0b2c3
+Create Date: 2024-01-16 10:41:52.027366
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71a3e5f8d20'
+down_revision = '9d4e61f0b2c3'
+branch_labels = None
+depends_on = None
+
+# The venue and artist pages filter Show by one foreign key and split on
+# start_time. Ordering by start_time alone is already covered by
+# ix_Show_start_time_id from the keyset pagination migration.
+INDEXES = [
+    ('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], {}),
+    ('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], {}),
+    ('ix_Venue_genres', 'Venue', ['genres'], {'postgresql_using': 'gin'}),
+    ('ix_Artist_genres', 'Artist', ['genres'], {'postgresql_using': 'gin'}),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+    with op.get_context().autocommit_block():
+        for name, table, columns, options in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True,
+                            **options)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, options in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
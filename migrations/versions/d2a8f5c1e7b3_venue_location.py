@@ -0,0 +1,92 @@
+"""venue location
+
+Revision ID: d2a8f5c1e7b3
+Revises: b6e1c4f8a3d7
+Create Date: 2024-02-26 15:08:52.477130
+
+"""
+import csv
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a8f5c1e7b3'
+down_revision = 'b6e1c4f8a3d7'
+branch_labels = None
+depends_on = None
+
+CITIES_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          '..', '..', 'data', 'us_cities.csv')
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('longitude', sa.Float(), nullable=True))
+
+    city_location = op.create_table('city_location',
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('latitude', sa.Float(), nullable=False),
+    sa.Column('longitude', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('state', 'city')
+    )
+    with open(CITIES_CSV, newline='', encoding='utf-8') as f:
+        op.bulk_insert(city_location, [
+            {'city': row['city'], 'state': row['state'],
+             'latitude': float(row['latitude']),
+             'longitude': float(row['longitude'])}
+            for row in csv.DictReader(f)])
+
+    # New venues, and venues moving to another city, are placed at the
+    # centre of their city unless coordinates are given on insert.
+    op.execute("""
+        CREATE FUNCTION fyyur_locate_venue() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' AND NEW.latitude IS NOT NULL THEN
+                RETURN NEW;
+            END IF;
+            IF TG_OP = 'UPDATE' AND NEW.city IS NOT DISTINCT FROM OLD.city
+                    AND NEW.state IS NOT DISTINCT FROM OLD.state THEN
+                RETURN NEW;
+            END IF;
+            SELECT latitude, longitude INTO NEW.latitude, NEW.longitude
+            FROM city_location
+            WHERE state = NEW.state AND lower(city) = lower(NEW.city);
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER venue_location
+        BEFORE INSERT OR UPDATE OF city, state ON "Venue"
+        FOR EACH ROW EXECUTE PROCEDURE fyyur_locate_venue()
+    """)
+    op.execute("""
+        UPDATE "Venue"
+        SET latitude = city_location.latitude,
+            longitude = city_location.longitude
+        FROM city_location
+        WHERE city_location.state = "Venue".state
+          AND lower(city_location.city) = lower("Venue".city)
+    """)
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS cube')
+    op.execute('CREATE EXTENSION IF NOT EXISTS earthdistance')
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+    with op.get_context().autocommit_block():
+        op.execute('CREATE INDEX CONCURRENTLY "ix_Venue_earth" ON "Venue" '
+                   'USING gist (ll_to_earth(latitude, longitude)) '
+                   'WHERE latitude IS NOT NULL')
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY "ix_Venue_earth"')
+    op.execute('DROP TRIGGER venue_location ON "Venue"')
+    op.execute('DROP FUNCTION fyyur_locate_venue()')
+    op.drop_table('city_location')
+    op.drop_column('Venue', 'longitude')
+    op.drop_column('Venue', 'latitude')
@@ -0,0 +1,34 @@
+"""area feed version index
+
+Revision ID: e5f1a9c3d7b2
+Revises: a4e8b2f7c931
+Create Date: 2024-03-20 11:02:39.184620
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5f1a9c3d7b2'
+down_revision = 'a4e8b2f7c931'
+branch_labels = None
+depends_on = None
+
+# The version of a city's calendar feed is aggregated over the ids and
+# version counters of its venues (see feeds.py); with both included in the
+# (state, city) index it is an index-only scan, so a poll answered 304
+# reads no row of "Venue".
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+    with op.get_context().autocommit_block():
+        op.execute('CREATE INDEX CONCURRENTLY "ix_Venue_state_city_version" '
+                   'ON "Venue" (state, city) INCLUDE (id, version)')
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_Venue_state_city_version', table_name='Venue',
+                      postgresql_concurrently=True)
@@ -0,0 +1,145 @@
+"""partition show
+
+Revision ID: f4b7d2a9c6e1
+Revises: 8a0f3c6e2b94
+Create Date: 2024-02-12 14:52:19.604137
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4b7d2a9c6e1'
+down_revision = '8a0f3c6e2b94'
+branch_labels = None
+depends_on = None
+
+# Months after the current one that get a partition; later ones are created
+# by 'flask partitions create'.
+MONTHS_AHEAD = 3
+
+INDEXES = [
+    ('ix_Show_start_time_id', ['start_time', 'id']),
+    ('ix_Show_venue_id_start_time', ['venue_id', 'start_time']),
+    ('ix_Show_artist_id_start_time', ['artist_id', 'start_time']),
+]
+
+# Upcoming shows are selected in the join condition rather than in FILTER
+# clauses, so the refresh only scans the partitions from now on.
+AREA_SUMMARY = """
+    CREATE MATERIALIZED VIEW venue_area_summary AS
+    SELECT "Venue".id AS venue_id,
+           "Venue".city,
+           "Venue".state,
+           "Venue".name,
+           count("Show".id) AS num_upcoming_shows,
+           min("Show".start_time) AS next_show
+    FROM "Venue" LEFT OUTER JOIN "Show"
+        ON "Show".venue_id = "Venue".id AND "Show".start_time > now()
+    GROUP BY "Venue".id
+"""
+
+PREVIOUS_AREA_SUMMARY = """
+    CREATE MATERIALIZED VIEW venue_area_summary AS
+    SELECT "Venue".id AS venue_id,
+           "Venue".city,
+           "Venue".state,
+           "Venue".name,
+           count("Show".id) FILTER (WHERE "Show".start_time > now())
+               AS num_upcoming_shows,
+           min("Show".start_time) FILTER (WHERE "Show".start_time > now())
+               AS next_show
+    FROM "Venue" LEFT OUTER JOIN "Show" ON "Show".venue_id = "Venue".id
+    GROUP BY "Venue".id
+"""
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def create_area_summary(definition):
+    op.execute(definition)
+    op.create_index('ix_venue_area_summary_venue_id', 'venue_area_summary',
+                    ['venue_id'], unique=True)
+    op.create_index('ix_venue_area_summary_area', 'venue_area_summary',
+                    ['state', 'city', 'name', 'venue_id'])
+    op.execute("UPDATE materialized_view_refresh SET refreshed_at = now() "
+               "WHERE view_name = 'venue_area_summary'")
+
+
+def add_constraints(primary_key):
+    op.create_primary_key('Show_pkey', 'Show', primary_key)
+    op.create_foreign_key('Show_venue_id_fkey', 'Show', 'Venue',
+                          ['venue_id'], ['id'])
+    op.create_foreign_key('Show_artist_id_fkey', 'Show', 'Artist',
+                          ['artist_id'], ['id'])
+    for name, columns in INDEXES:
+        op.create_index(name, 'Show', columns)
+
+
+def upgrade():
+    # The view depends on "Show" and is rebuilt on the new table.
+    op.execute('DROP MATERIALIZED VIEW venue_area_summary')
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_unpartitioned"')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+    op.execute("""
+        CREATE TABLE "Show" (
+            id integer NOT NULL DEFAULT nextval('"Show_id_seq"'),
+            venue_id integer NOT NULL,
+            artist_id integer NOT NULL,
+            start_time timestamp without time zone NOT NULL,
+            updated_at timestamp without time zone NOT NULL DEFAULT now()
+        ) PARTITION BY RANGE (start_time)
+    """)
+    op.execute('CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT')
+
+    # One partition per month that has shows, and for the months ahead.
+    months = {row[0].date() for row in op.get_bind().execute(
+        'SELECT DISTINCT date_trunc(\'month\', start_time) '
+        'FROM "Show_unpartitioned"')}
+    this_month = date.today().replace(day=1)
+    months.update(add_months(this_month, n) for n in range(MONTHS_AHEAD + 1))
+    for month in sorted(months):
+        op.execute('CREATE TABLE "%s" PARTITION OF "Show" '
+                   'FOR VALUES FROM (\'%s\') TO (\'%s\')'
+                   % (month.strftime('Show_p%Y_%m'), month.isoformat(),
+                      add_months(month, 1).isoformat()))
+
+    op.execute('INSERT INTO "Show" (id, venue_id, artist_id, start_time, updated_at) '
+               'SELECT id, venue_id, artist_id, start_time, updated_at '
+               'FROM "Show_unpartitioned"')
+    op.drop_table('Show_unpartitioned')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+
+    # A primary key on a partitioned table has to include the partition key;
+    # ids stay unique because they all come from the sequence.
+    add_constraints(['id', 'start_time'])
+    create_area_summary(AREA_SUMMARY)
+
+
+def downgrade():
+    op.execute('DROP MATERIALIZED VIEW venue_area_summary')
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_partitioned"')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+    op.create_table('Show',
+    sa.Column('id', sa.Integer(), nullable=False,
+              server_default=sa.text('nextval(\'"Show_id_seq"\')')),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(),
+              nullable=False)
+    )
+    op.execute('INSERT INTO "Show" (id, venue_id, artist_id, start_time, updated_at) '
+               'SELECT id, venue_id, artist_id, start_time, updated_at '
+               'FROM "Show_partitioned"')
+    # Drops the partitions with it.
+    op.drop_table('Show_partitioned')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    add_constraints(['id'])
+    create_area_summary(PREVIOUS_AREA_SUMMARY)
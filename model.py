@@ -1,7 +1,8 @@
-from flask_sqlalchemy import SQLAlchemy
+from replicas import RoutingSQLAlchemy
 
-# Initialized without explicit app (Flask instance)
-db = SQLAlchemy()
+# Initialized without explicit app (Flask instance). Reads may be routed to a
+# replica, see replicas.py.
+db = RoutingSQLAlchemy()
 
 # ----------------------------------------------------------------------------#
 # Models.
@@ -21,6 +22,10 @@ class Artist(db.Model):
     website_link = db.Column(db.String(500))
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(500))
+    updated_at = db.Column(db.DateTime, nullable=False,
+                           server_default=db.func.now(), onupdate=db.func.now())
+    # Bumped by triggers whenever the artist's page would change.
+    version = db.Column(db.Integer, nullable=False, server_default='0')
     shows = db.relationship('Show', backref='artist', lazy='dynamic')
 
 
@@ -41,14 +46,28 @@ class Venue(db.Model):
     website_link = db.Column(db.String(500))
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(500))
+    # Set from the city by a trigger unless given, see geo.py.
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    updated_at = db.Column(db.DateTime, nullable=False,
+                           server_default=db.func.now(), onupdate=db.func.now())
+    # Bumped by triggers whenever the venue's page would change.
+    version = db.Column(db.Integer, nullable=False, server_default='0')
     shows = db.relationship('Show', backref='venue', lazy='dynamic')
 
 
 class Show(db.Model):
+    # Partitioned by month on start_time (see partitions.py); in the database
+    # the primary key is (id, start_time), ids come from one sequence.
     __tablename__ = 'Show'
 
     id = db.Column(db.Integer, primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey(
         'Artist.id'), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False)
\ No newline at end of file
+    start_time = db.Column(db.DateTime, nullable=False)
+    # The venue is booked from start_time for this long, see bookings.py.
+    duration_minutes = db.Column(db.Integer, nullable=False,
+                                 server_default='120')
+    updated_at = db.Column(db.DateTime, nullable=False,
+                           server_default=db.func.now(), onupdate=db.func.now())
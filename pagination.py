@@ -0,0 +1,78 @@
+import base64
+import binascii
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from flask import abort, current_app
+from sqlalchemy import DateTime, String, func, tuple_
+
+# ----------------------------------------------------------------------------#
+# Keyset pagination.
+# ----------------------------------------------------------------------------#
+# Pages are addressed by an opaque cursor holding the sort key of the last row
+# of the previous page, so fetching page N is an index range scan starting at
+# that key instead of an OFFSET that has to walk past every earlier row.
+#
+# A row comparison involving NULL is NULL, which would drop every row with a
+# NULL key. Nullable text keys are sorted and compared as coalesce(key, ''),
+# so those rows come first; the indexes of the listings are built on the
+# same expressions.
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+
+def sort_key(key):
+    if isinstance(key.type, String) and getattr(key, 'nullable', True):
+        return func.coalesce(key, '')
+    return key
+
+
+def encode_cursor(values):
+    payload = json.dumps([value.isoformat() if isinstance(value, datetime)
+                          else value for value in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, keys):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError(cursor)
+        # Anything else would reach the driver as a parameter it cannot adapt.
+        if not all(value is None or isinstance(value, (str, int, float))
+                   for value in values):
+            raise ValueError(cursor)
+        return [datetime.fromisoformat(value)
+                if isinstance(key.type, DateTime) else value
+                for key, value in zip(keys, values)]
+    except (ValueError, TypeError, binascii.Error):
+        abort(400)
+
+
+def keyset_query(query, keys, cursor=None, per_page=None):
+    # The page plus one row, which tells whether a next page exists.
+    per_page = per_page or current_app.config['PAGE_SIZE']
+    sort_keys = [sort_key(key) for key in keys]
+    if cursor:
+        values = decode_cursor(cursor, keys)
+        query = query.filter(tuple_(*sort_keys) > tuple_(*values))
+    return query.order_by(*sort_keys).limit(per_page + 1)
+
+
+def keyset_page(query, keys, cursor=None, per_page=None):
+    # keys must be unique together (end with a primary key) and be selected by
+    # the query under their own attribute names.
+    per_page = per_page or current_app.config['PAGE_SIZE']
+    rows = keyset_query(query, keys, cursor, per_page).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        values = [getattr(rows[-1], key.key) for key in keys]
+        # The cursor holds the keys as they are sorted.
+        next_cursor = encode_cursor([
+            '' if value is None and sort_key(key) is not key else value
+            for key, value in zip(keys, values)])
+    return Page(rows, next_cursor)
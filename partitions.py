@@ -0,0 +1,223 @@
+import re
+from datetime import date, datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+import bookings
+from model import db
+
+# ----------------------------------------------------------------------------#
+# Show partitions.
+# ----------------------------------------------------------------------------#
+# "Show" is range partitioned on start_time with one partition per calendar
+# month, named Show_pYYYY_MM, and a Show_default partition that takes rows
+# outside every monthly range so that inserts never fail. Queries bounded on
+# start_time (upcoming shows, the keyset-paginated listing, date filtered
+# exports, the venue_area_summary refresh) only scan the matching months, and
+# each month has its own small indexes to vacuum.
+#
+#   flask partitions list
+#   flask partitions create [--months-ahead N]
+#   flask partitions archive [--keep-months N] [--schema NAME | --drop]
+#
+# create is meant to run from cron well before the last monthly partition
+# fills up. Rows that reached the default partition for a month that gets
+# its own partition are moved into it. archive detaches the months that
+# ended before the retention period, which removes their shows from the
+# site, and moves them to an archive schema or drops them.
+
+PARENT = 'Show'
+DEFAULT_PARTITION = 'Show_default'
+NAME_FORMAT = 'Show_p%Y_%m'
+BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return month.strftime(NAME_FORMAT)
+
+
+def lock():
+    # Serializes maintenance runs until the end of the transaction.
+    db.session.execute("SELECT pg_advisory_xact_lock(hashtext('Show partitions'))")
+
+
+def list_partitions():
+    """Attached partitions as (name, lower, upper, estimated rows); the bounds
+    of the default partition are None."""
+    rows = db.session.execute("""
+        SELECT child.relname,
+               pg_get_expr(child.relpartbound, child.oid),
+               child.reltuples
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = '"%s"'::regclass
+        ORDER BY child.relname""" % PARENT)
+    partitions = []
+    for name, bound, estimate in rows:
+        match = BOUND.search(bound)
+        lower = upper = None
+        if match:
+            lower, upper = (datetime.fromisoformat(value).date()
+                            for value in match.groups())
+        partitions.append((name, lower, upper, int(max(estimate, 0))))
+    return partitions
+
+
+def create_partition(month):
+    """Create and attach the partition for one month. Returns the number of
+    rows moved into it from the default partition."""
+    name = partition_name(month)
+    lower, upper = month.isoformat(), add_months(month, 1).isoformat()
+    # Attaching a range fails while the default partition holds rows in it,
+    # so those rows are moved into the new table first. ATTACH PARTITION
+    # only takes a SHARE UPDATE EXCLUSIVE lock on "Show"; the matching
+    # indexes, primary key and foreign keys are added to the new partition.
+    # The shows keep their venue bookings, so the booking trigger is told to
+    # ignore the move.
+    db.session.execute('CREATE TABLE "%s" (LIKE "%s" INCLUDING DEFAULTS '
+                       'INCLUDING CONSTRAINTS)' % (name, PARENT))
+    db.session.execute("SET LOCAL fyyur.moving_partition = 'on'")
+    moved = db.session.execute(
+        'WITH moved AS (DELETE FROM "%s" WHERE start_time >= \'%s\' '
+        'AND start_time < \'%s\' RETURNING *) '
+        'INSERT INTO "%s" SELECT * FROM moved'
+        % (DEFAULT_PARTITION, lower, upper, name)).rowcount
+    db.session.execute("SET LOCAL fyyur.moving_partition = 'off'")
+    db.session.execute('ALTER TABLE "%s" ATTACH PARTITION "%s" '
+                       'FOR VALUES FROM (\'%s\') TO (\'%s\')'
+                       % (PARENT, name, lower, upper))
+    return moved
+
+
+def ensure_partitions(start, end):
+    """Create the missing monthly partitions from start to end inclusive and
+    return (name, rows moved) for each. The caller commits."""
+    lock()
+    existing = {name for name, _, _, _ in list_partitions()}
+    created = []
+    month, last = month_start(start), month_start(end)
+    while month <= last:
+        name = partition_name(month)
+        if name not in existing:
+            moved = create_partition(month)
+            created.append((name, moved))
+        month = add_months(month, 1)
+    return created
+
+
+def archive_partitions(before, schema=None):
+    """Detach the monthly partitions that end on or before `before`, freeing
+    their venue bookings, then move them to `schema` or drop them if schema is
+    None. The caller commits."""
+    lock()
+    archived = []
+    for name, lower, upper, _ in list_partitions():
+        if upper is None or upper > before:
+            continue
+        bookings.forget_shows(name)
+        # Detaching fires no trigger: the pages of the venues and artists
+        # of the archived shows get a new version here.
+        for table, key in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+            db.session.execute('UPDATE "%s" SET version = version + 1 '
+                               'WHERE id IN (SELECT %s FROM "%s")'
+                               % (table, key, name))
+        db.session.execute('ALTER TABLE "%s" DETACH PARTITION "%s"'
+                           % (PARENT, name))
+        if schema is None:
+            db.session.execute('DROP TABLE "%s"' % name)
+        else:
+            # Archived shows must not keep their venues and artists from
+            # being deleted, so the foreign keys are dropped with the move.
+            foreign_keys = db.session.execute(
+                "SELECT conname FROM pg_constraint "
+                "WHERE conrelid = '\"%s\"'::regclass AND contype = 'f'" % name)
+            for constraint, in foreign_keys.fetchall():
+                db.session.execute('ALTER TABLE "%s" DROP CONSTRAINT "%s"'
+                                   % (name, constraint))
+            db.session.execute('CREATE SCHEMA IF NOT EXISTS "%s"' % schema)
+            db.session.execute('ALTER TABLE "%s" SET SCHEMA "%s"'
+                               % (name, schema))
+        archived.append(name)
+    return archived
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    # Keeps 'flask db migrate' from proposing to drop the partitions, which
+    # are not part of the models.
+    if type_ == 'table' and reflected and compare_to is None:
+        return not (name == DEFAULT_PARTITION or name.startswith('Show_p'))
+    return True
+
+
+partitions_command = AppGroup('partitions',
+                              help='Maintain the monthly partitions of Show.')
+
+
+@partitions_command.command('list')
+def list_command():
+    """List the partitions of Show with their estimated row counts."""
+    for name, lower, upper, estimate in list_partitions():
+        span = '%s .. %s' % (lower, upper) if lower else 'default'
+        click.echo('%-16s %-26s ~%d rows' % (name, span, estimate))
+
+
+@partitions_command.command('create')
+@click.option('--months-ahead', type=int,
+              help='Months after the current one to create partitions for; '
+                   'defaults to SHOW_PARTITION_MONTHS_AHEAD.')
+def create_command(months_ahead):
+    """Create the partitions for the current and the coming months."""
+    if months_ahead is None:
+        months_ahead = current_app.config['SHOW_PARTITION_MONTHS_AHEAD']
+    this_month = month_start(date.today())
+    try:
+        created = ensure_partitions(this_month, add_months(this_month, months_ahead))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    for name, moved in created:
+        click.echo('Created %s (%d rows moved from %s)'
+                   % (name, moved, DEFAULT_PARTITION))
+    if not created:
+        click.echo('All partitions up to %s exist'
+                   % partition_name(add_months(this_month, months_ahead)))
+
+
+@partitions_command.command('archive')
+@click.option('--keep-months', type=int,
+              help='Full months of past shows to keep attached; defaults to '
+                   'SHOW_PARTITION_RETENTION_MONTHS.')
+@click.option('--schema', default='archive', show_default=True,
+              help='Schema the detached partitions are moved to.')
+@click.option('--drop', is_flag=True,
+              help='Drop the detached partitions instead of keeping them.')
+def archive_command(keep_months, schema, drop):
+    """Detach the partitions older than the retention period."""
+    if keep_months is None:
+        keep_months = current_app.config['SHOW_PARTITION_RETENTION_MONTHS']
+    before = add_months(month_start(date.today()), -keep_months)
+    try:
+        archived = archive_partitions(before, None if drop else schema)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    # Nothing to invalidate: this process shares no cache with the workers,
+    # and the pages listing the archived shows are keyed by versions that
+    # archive_partitions changed (see queries.py).
+    for name in archived:
+        click.echo('%s %s' % ('Dropped' if drop else 'Archived to %s:' % schema, name))
+    if not archived:
+        click.echo('No partitions end before %s' % before)
@@ -0,0 +1,457 @@
+import functools
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, or_, true, tuple_
+
+import area_summary
+from area_summary import materialized_view_refresh, venue_area_summary
+from autocomplete import autocomplete
+from cache import cache
+from model import db, Artist, Venue, Show
+from pagination import decode_cursor, encode_cursor, keyset_page, keyset_query
+from recommendations import recommender
+
+# ----------------------------------------------------------------------------#
+# Listings.
+# ----------------------------------------------------------------------------#
+
+
+def build_venue_areas(cursor=None):
+    # Venues with their upcoming show counts come from the venue_area_summary
+    # materialized view, ordered so that venues of the same area are adjacent.
+    summary = venue_area_summary.c
+    query = db.session.query(summary.venue_id, summary.city, summary.state,
+                             summary.name, summary.num_upcoming_shows)
+    page = keyset_page(query, [summary.state, summary.city, summary.name,
+                               summary.venue_id], cursor=cursor)
+
+    areas = []
+    for row in page.items:
+        if not areas or (areas[-1]['city'], areas[-1]['state']) != (row.city, row.state):
+            areas.append({
+                'city': row.city,
+                'state': row.state,
+                'venues': []
+            })
+        areas[-1]['venues'].append({
+            'id': row.venue_id,
+            'name': row.name,
+            'num_upcoming_shows': row.num_upcoming_shows
+        })
+
+    return {
+        'areas': areas,
+        'next_cursor': page.next_cursor
+    }
+
+
+def build_artist_list(cursor=None):
+    query = Artist.query.with_entities(Artist.id, Artist.name)
+    page = keyset_page(query, [Artist.name, Artist.id], cursor=cursor)
+    return {
+        'artists': [{'id': row.id, 'name': row.name} for row in page.items],
+        'next_cursor': page.next_cursor
+    }
+
+
+def show_query(start=None, end=None, venue_id=None, artist_id=None):
+    query = Show.query.join(Venue, Venue.id == Show.venue_id)\
+        .join(Artist, Artist.id == Show.artist_id)\
+        .with_entities(Show.id, Show.venue_id, Venue.name.label('venue_name'),
+                       Show.artist_id, Artist.name.label('artist_name'),
+                       Artist.image_link.label('artist_image_link'), Show.start_time,
+                       Show.duration_minutes)
+    if start is not None:
+        query = query.filter(Show.start_time >= start)
+    if end is not None:
+        query = query.filter(Show.start_time < end)
+    if venue_id is not None:
+        query = query.filter(Show.venue_id == venue_id)
+    if artist_id is not None:
+        query = query.filter(Show.artist_id == artist_id)
+    return query
+
+
+def build_show_list(cursor=None):
+    # The version changes whenever anything shown on the tile does.
+    query = show_query().add_columns(
+        func.greatest(Show.updated_at, Venue.updated_at, Artist.updated_at)
+        .label('version'))
+    page = keyset_page(query, [Show.start_time, Show.id], cursor=cursor)
+
+    shows = []
+    for show in page.items:
+        shows.append({
+            'id': show.id,
+            'version': str(show.version),
+            'venue_id': show.venue_id,
+            'venue_name': show.venue_name,
+            'artist_id': show.artist_id,
+            'start_time': str(show.start_time),
+            'artist_name': show.artist_name,
+            'artist_image_link': show.artist_image_link
+        })
+    return {
+        'shows': shows,
+        'next_cursor': page.next_cursor
+    }
+
+# ----------------------------------------------------------------------------#
+# Detail pages.
+# ----------------------------------------------------------------------------#
+# A venue or artist page is served by one statement returning the entity
+# joined to its shows, each show flagged as past or upcoming by the database
+# clock. Past shows are listed most recent first and capped at
+# PAST_SHOWS_LIMIT; older ones are reached through a (start_time, id) cursor.
+
+
+def detail_rows(model, model_id, owner_key, counterpart, counterpart_key,
+                columns, past_before=None, past_limit=None):
+    upcoming = Show.start_time > func.now()
+    shows = db.session.query(Show.id.label('show_id'),
+                             Show.start_time,
+                             upcoming.label('upcoming'),
+                             func.count().over(partition_by=upcoming).label('total'),
+                             func.greatest(Show.updated_at, counterpart.updated_at)
+                             .label('version'),
+                             *columns)\
+        .join(counterpart, counterpart.id == counterpart_key)\
+        .filter(owner_key == model_id)\
+        .subquery()
+
+    # Ranking happens after the cursor filter so that the cap applies to the
+    # requested continuation, while 'total' still counts every past show.
+    ranked = db.session.query(shows,
+                              func.row_number().over(
+                                  partition_by=shows.c.upcoming,
+                                  order_by=(shows.c.start_time.desc(),
+                                            shows.c.show_id.desc())
+                              ).label('past_rank'))
+    if past_before:
+        ranked = ranked.filter(or_(
+            shows.c.upcoming,
+            tuple_(shows.c.start_time, shows.c.show_id) < tuple_(*past_before)))
+    ranked = ranked.subquery()
+
+    # One extra past show is fetched to know whether to offer "show more".
+    return db.session.query(model, ranked)\
+        .outerjoin(ranked, true())\
+        .filter(model.id == model_id)\
+        .filter(or_(ranked.c.show_id.is_(None),
+                    ranked.c.upcoming,
+                    ranked.c.past_rank <= past_limit + 1))\
+        .order_by(ranked.c.start_time, ranked.c.show_id)\
+        .all()
+
+
+def split_shows(rows, past_limit, build_show):
+    past_rows, upcoming_shows = [], []
+    past_count = upcoming_count = 0
+    for row in rows:
+        if row.show_id is None:
+            continue
+        if row.upcoming:
+            upcoming_shows.append(build_show(row))
+            upcoming_count = row.total
+        else:
+            past_rows.append(row)
+            past_count = row.total
+
+    past_rows.reverse()
+    past_cursor = None
+    if len(past_rows) > past_limit:
+        past_rows = past_rows[:past_limit]
+        past_cursor = encode_cursor([past_rows[-1].start_time,
+                                     past_rows[-1].show_id])
+
+    return {
+        "past_shows": [build_show(row) for row in past_rows],
+        "upcoming_shows": upcoming_shows,
+        "past_shows_count": past_count,
+        "upcoming_shows_count": upcoming_count,
+        "past_shows_cursor": past_cursor
+    }
+
+
+def build_venue_detail(venue_id, past_before=None):
+    past_limit = current_app.config['PAST_SHOWS_LIMIT']
+    if past_before:
+        past_before = decode_cursor(past_before, [Show.start_time, Show.id])
+    rows = detail_rows(Venue, venue_id, Show.venue_id, Artist, Show.artist_id,
+                       [Show.artist_id,
+                        Artist.name.label('artist_name'),
+                        Artist.image_link.label('artist_image_link')],
+                       past_before=past_before, past_limit=past_limit)
+    if not rows:
+        return None
+
+    venue = rows[0].Venue
+    data = {
+        "id": venue.id,
+        "name": venue.name,
+        "genres": venue.genres,
+        "address": venue.address,
+        "city": venue.city,
+        "state": venue.state,
+        "phone": venue.phone,
+        "website": venue.website_link,
+        "facebook_link": venue.facebook_link,
+        "seeking_talent": venue.seeking_talent,
+        "seeking_description": venue.seeking_description,
+        "image_link": venue.image_link
+    }
+    data.update(split_shows(rows, past_limit, lambda show: {
+        'id': show.show_id,
+        'version': str(show.version),
+        'artist_id': show.artist_id,
+        'artist_name': show.artist_name,
+        'artist_image_link': show.artist_image_link,
+        'start_time': str(show.start_time)
+    }))
+    return data
+
+
+def build_artist_detail(artist_id, past_before=None):
+    past_limit = current_app.config['PAST_SHOWS_LIMIT']
+    if past_before:
+        past_before = decode_cursor(past_before, [Show.start_time, Show.id])
+    rows = detail_rows(Artist, artist_id, Show.artist_id, Venue, Show.venue_id,
+                       [Show.venue_id,
+                        Venue.name.label('venue_name'),
+                        Venue.image_link.label('venue_image_link')],
+                       past_before=past_before, past_limit=past_limit)
+    if not rows:
+        return None
+
+    artist = rows[0].Artist
+    data = {
+        "id": artist.id,
+        "name": artist.name,
+        "genres": artist.genres,
+        "city": artist.city,
+        "state": artist.state,
+        "phone": artist.phone,
+        "facebook_link": artist.facebook_link,
+        "seeking_venue": artist.seeking_venue,
+        "seeking_description": artist.seeking_description,
+        "website": artist.website_link,
+        "image_link": artist.image_link
+    }
+    data.update(split_shows(rows, past_limit, lambda show: {
+        'id': show.show_id,
+        'version': str(show.version),
+        'venue_id': show.venue_id,
+        'venue_image_link': show.venue_image_link,
+        'venue_name': show.venue_name,
+        'start_time': str(show.start_time)
+    }))
+    return data
+
+
+# ----------------------------------------------------------------------------#
+# Versions.
+# ----------------------------------------------------------------------------#
+# A version is a small tuple of timestamps and counts that changes whenever
+# the data built for a page would change, including a show moving from
+# upcoming to past. It is computed with one query, without loading or
+# serializing the rows of the page, and is used for ETag and Last-Modified
+# headers and in cache keys; its timestamps are in UTC. A listing page is
+# versioned by an aggregate over its rows: the sum of their ids changes when
+# a row leaves it and the next one moves up. A venue or an artist page by
+# the version counter of its row, kept up to date by triggers.
+
+
+def utc(timestamp):
+    # Timestamps are stored in the database's local time, without a zone.
+    return func.timezone('UTC', func.timezone(func.current_setting('TimeZone'),
+                                              timestamp))
+
+
+def venue_areas_version(cursor=None):
+    # The view only changes when it is refreshed.
+    refreshed_at = db.session.query(utc(materialized_view_refresh.c.refreshed_at))\
+        .filter(materialized_view_refresh.c.view_name == area_summary.VIEW_NAME)\
+        .scalar()
+    return (refreshed_at, cursor)
+
+
+def artist_list_version(cursor=None):
+    page = keyset_query(db.session.query(Artist.id, Artist.name,
+                                         Artist.updated_at),
+                        [Artist.name, Artist.id], cursor).subquery()
+    return tuple(db.session.query(func.count(), func.sum(page.c.id),
+                                  utc(func.max(page.c.updated_at)))
+                 .select_from(page).one())
+
+
+def show_list_version(cursor=None):
+    page = keyset_query(show_query().add_columns(
+                            func.greatest(Show.updated_at, Venue.updated_at,
+                                          Artist.updated_at).label('updated_at')),
+                        [Show.start_time, Show.id], cursor).subquery()
+    return tuple(db.session.query(func.count(), func.sum(page.c.id),
+                                  utc(func.max(page.c.updated_at)))
+                 .select_from(page).one())
+
+
+def detail_version(model, model_id, owner_key):
+    # The version column counts the writes to the page (see the page
+    # versions migration); the start of the latest show that has started
+    # changes when an upcoming show moves to the past. Both are index
+    # lookups, whatever the number of shows.
+    latest_started = db.session.query(func.max(Show.start_time))\
+        .filter(owner_key == model_id, Show.start_time <= func.now())\
+        .as_scalar()
+    row = db.session.query(model.version, utc(model.updated_at),
+                           latest_started)\
+        .filter(model.id == model_id)\
+        .first()
+    return tuple(row) if row else None
+
+
+def venue_version(venue_id):
+    return detail_version(Venue, venue_id, Show.venue_id)
+
+
+def artist_version(artist_id):
+    return detail_version(Artist, artist_id, Show.artist_id)
+
+
+# ----------------------------------------------------------------------------#
+# Cached access.
+# ----------------------------------------------------------------------------#
+# Views read through these wrappers. Every cached value lives in the
+# namespaces of the rows it was built from, and the write paths call the
+# *_changed functions below after committing; the calendar feeds (feeds.py)
+# share these namespaces. Detail pages also expire when their next upcoming
+# show starts, so that it moves to the past; the venue listing is invalidated
+# whenever its materialized view is refreshed.
+#
+# Invalidation only reaches the cache of the process that made the write,
+# so every value is also keyed by the current version of its data (see
+# above), queried first unless the caller already has it: a value cached
+# for an older version is never returned, whatever other processes wrote.
+# A page served from the cache still costs that one query: a primary key
+# lookup for a detail page, an aggregate over one page of a listing.
+
+
+def first_upcoming(data):
+    if not data['upcoming_shows']:
+        return None
+    return datetime.fromisoformat(data['upcoming_shows'][0]['start_time'])
+
+
+def venue_areas(cursor=None, version=None):
+    if version is None:
+        version = venue_areas_version(cursor)
+    return cache.memoize(f'venues:{cursor}:{version}',
+                         lambda: build_venue_areas(cursor),
+                         namespaces=['venues'])
+
+
+def artist_list(cursor=None, version=None):
+    if version is None:
+        version = artist_list_version(cursor)
+    return cache.memoize(f'artists:{cursor}:{version}',
+                         lambda: build_artist_list(cursor),
+                         namespaces=['artists'])
+
+
+def show_list(cursor=None, version=None):
+    if version is None:
+        version = show_list_version(cursor)
+    return cache.memoize(f'shows:{cursor}:{version}',
+                         lambda: build_show_list(cursor),
+                         namespaces=['shows'])
+
+
+def venue_detail(venue_id, past_before=None, version=None):
+    if version is None:
+        version = venue_version(venue_id)
+        if version is None:
+            return None
+    return cache.memoize(f'venue:{venue_id}:{past_before}:{version}',
+                         lambda: build_venue_detail(venue_id, past_before),
+                         namespaces=[f'venue:{venue_id}'],
+                         expires_at=first_upcoming)
+
+
+def artist_detail(artist_id, past_before=None, version=None):
+    if version is None:
+        version = artist_version(artist_id)
+        if version is None:
+            return None
+    return cache.memoize(f'artist:{artist_id}:{past_before}:{version}',
+                         lambda: build_artist_detail(artist_id, past_before),
+                         namespaces=[f'artist:{artist_id}'],
+                         expires_at=first_upcoming)
+
+
+def after_commit(invalidate):
+    # The write handlers call these once the write is committed: a failure
+    # here is logged rather than reported to the user as a failed write.
+    @functools.wraps(invalidate)
+    def wrapper(*args, **kwargs):
+        try:
+            invalidate(*args, **kwargs)
+        except Exception:
+            current_app.logger.exception('%s failed', invalidate.__name__)
+            db.session.rollback()
+    return wrapper
+
+
+def area_namespace(city, state):
+    # Shows of all venues in a city, as in its calendar feed.
+    return f'area:{state}:{city}'
+
+
+def venue_artist_ids(venue_id):
+    return [row.artist_id for row in db.session.query(Show.artist_id)
+            .filter(Show.venue_id == venue_id)
+            .distinct()]
+
+
+@after_commit
+def venue_changed(venue_id, previous_area=None, artist_ids=None):
+    # Artist pages show the names and images of the venues they played at.
+    # A venue that moved leaves the feed of its previous city. A deleted
+    # venue can no longer be read: its area and artists are passed in.
+    if artist_ids is None:
+        artist_ids = venue_artist_ids(venue_id)
+    areas = [previous_area] if previous_area else []
+    venue = db.session.query(Venue.city, Venue.state)\
+        .filter(Venue.id == venue_id).first()
+    if venue is not None:
+        areas.append((venue.city, venue.state))
+    cache.invalidate('venues', 'shows', f'venue:{venue_id}',
+                     *[f'artist:{artist_id}' for artist_id in artist_ids],
+                     *[area_namespace(city, state) for city, state in areas])
+    area_summary.refresher.request_refresh()
+    autocomplete.changed('venue', venue_id)
+    recommender.changed('venue', venue_id)
+
+
+@after_commit
+def artist_changed(artist_id):
+    venues = db.session.query(Show.venue_id, Venue.city, Venue.state)\
+        .join(Venue, Venue.id == Show.venue_id)\
+        .filter(Show.artist_id == artist_id)\
+        .distinct()
+    namespaces = set()
+    for row in venues:
+        namespaces.add(f'venue:{row.venue_id}')
+        namespaces.add(area_namespace(row.city, row.state))
+    cache.invalidate('artists', 'shows', f'artist:{artist_id}', *namespaces)
+    autocomplete.changed('artist', artist_id)
+    recommender.changed('artist', artist_id)
+
+
+@after_commit
+def show_changed(venue_id, artist_id):
+    venue = db.session.query(Venue.city, Venue.state)\
+        .filter(Venue.id == venue_id).first()
+    areas = [area_namespace(venue.city, venue.state)] if venue else []
+    cache.invalidate('venues', 'shows', f'venue:{venue_id}',
+                     f'artist:{artist_id}', *areas)
+    area_summary.refresher.request_refresh()
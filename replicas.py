@@ -0,0 +1,99 @@
+import random
+import time
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy, get_state
+from sqlalchemy import orm
+
+# ----------------------------------------------------------------------------#
+# Read replicas.
+# ----------------------------------------------------------------------------#
+# SQLALCHEMY_REPLICA_URIS lists read replicas of SQLALCHEMY_DATABASE_URI.
+# Each one becomes a Flask-SQLAlchemy bind (replica0, replica1, ...) sharing
+# the pool options of the primary. A request is served from one replica,
+# picked at random, when:
+#   - its method is GET, HEAD or OPTIONS, or its view is marked @read_only
+#     (the searches are POSTs that only read);
+#   - its view is not marked @use_primary;
+#   - the client has not written in the last REPLICA_STICKY_SECONDS, so that
+#     users read their own writes after a redirect.
+# Everything else, including the CLI and background threads, uses the
+# primary. Flushes always go to the primary.
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_KEY = 'read_primary_until'
+
+
+def read_only(view):
+    """Serve a view that only reads from a replica whatever its method."""
+    view.read_replica = True
+    return view
+
+
+def use_primary(view):
+    """Always serve a view from the primary."""
+    view.read_replica = False
+    return view
+
+
+def reading_from_replica():
+    return has_request_context() and g.get('read_replica') is not None
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+        if has_request_context() and not self._flushing:
+            bind_key = g.get('read_replica')
+            if bind_key is not None:
+                return get_state(self.app).db.get_engine(self.app, bind=bind_key)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def dispose_engines(self, app):
+        """Close the pooled connections of the primary and every bind; the
+        engines open new ones on next use."""
+        binds = [None] + list(app.config.get('SQLALCHEMY_BINDS') or ())
+        for bind in binds:
+            self.get_engine(app, bind=bind).dispose()
+
+
+class ReplicaRouter(object):
+
+    def __init__(self, app=None):
+        self.bind_keys = []
+        self.sticky_seconds = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        uris = app.config['SQLALCHEMY_REPLICA_URIS']
+        if not uris:
+            return
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        self.bind_keys = ['replica%d' % index for index in range(len(uris))]
+        binds.update(zip(self.bind_keys, uris))
+        app.config['SQLALCHEMY_BINDS'] = binds
+        self.sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+        app.before_request(self.route_request)
+        app.after_request(self.remember_write)
+        app.extensions['replicas'] = self
+
+    def route_request(self):
+        view = current_app.view_functions.get(request.endpoint)
+        use_replica = getattr(view, 'read_replica', request.method in SAFE_METHODS)
+        if use_replica and session.get(STICKY_KEY, 0) < time.time():
+            g.read_replica = random.choice(self.bind_keys)
+
+    def remember_write(self, response):
+        if request.method not in SAFE_METHODS and not g.get('read_replica'):
+            session[STICKY_KEY] = time.time() + self.sticky_seconds
+        return response
+
+
+router = ReplicaRouter()
@@ -0,0 +1,75 @@
+from flask import current_app
+from sqlalchemy import func, literal_column, or_
+
+from model import db, Artist, Venue, Show
+
+# ----------------------------------------------------------------------------#
+# Search.
+# ----------------------------------------------------------------------------#
+# Venues and artists are matched on a single text document built from their
+# name, city, state and genres. The expressions below must stay identical to
+# the ones indexed in migration 5b8e0c2d4a17, otherwise PostgreSQL falls back
+# to a sequential scan.
+
+TS_CONFIG = literal_column("'simple'::regconfig")
+
+
+def search_document(model):
+    return func.fyyur_search_document(model.name, model.city, model.state,
+                                      model.genres)
+
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def match(model, term):
+    # Full-text hits catch whole words in any order, the trigram ILIKE catches
+    # substrings ("rock" in "Hard Rock Cafe", "Francisco" for "San Fr...").
+    # Both predicates are served by GIN indexes and combined with a BitmapOr.
+    document = search_document(model)
+    tsquery = func.plainto_tsquery(TS_CONFIG, term)
+    tsvector = func.to_tsvector(TS_CONFIG, document)
+    condition = or_(tsvector.op('@@')(tsquery),
+                    document.ilike(f'%{escape_like(term.lower())}%'))
+    rank = func.ts_rank(tsvector, tsquery) + func.word_similarity(term, document)
+    return condition, rank
+
+
+def search_venues(term, limit=None):
+    limit = limit or current_app.config['SEARCH_RESULT_LIMIT']
+    term = term.strip()
+
+    hits = db.session.query(Venue.id, Venue.name)
+    if term:
+        condition, rank = match(Venue, term)
+        hits = hits.add_columns(rank.label('rank'))\
+            .filter(condition)\
+            .order_by(rank.desc(), Venue.id)
+    else:
+        hits = hits.add_columns(literal_column('0').label('rank'))\
+            .order_by(Venue.name, Venue.id)
+    hits = hits.limit(limit).subquery()
+
+    # Upcoming show counts are only computed for the page of hits.
+    return db.session.query(hits.c.id, hits.c.name,
+                            func.count(Show.id)
+                                .filter(Show.start_time > func.now())
+                                .label('num_upcoming_shows'))\
+        .outerjoin(Show, Show.venue_id == hits.c.id)\
+        .group_by(hits.c.id, hits.c.name, hits.c.rank)\
+        .order_by(hits.c.rank.desc(), hits.c.name, hits.c.id)\
+        .all()
+
+
+def search_artists(term, limit=None):
+    limit = limit or current_app.config['SEARCH_RESULT_LIMIT']
+    term = term.strip()
+
+    hits = db.session.query(Artist.id, Artist.name)
+    if term:
+        condition, rank = match(Artist, term)
+        hits = hits.filter(condition).order_by(rank.desc(), Artist.id)
+    else:
+        hits = hits.order_by(Artist.name, Artist.id)
+    return hits.limit(limit).all()
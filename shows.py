@@ -0,0 +1,106 @@
+import sys
+from datetime import datetime
+
+from flask import Blueprint, abort, flash, render_template, request
+
+import bookings
+import queries
+from export import export_response
+from forms import ShowForm
+from model import db, Show
+
+# ----------------------------------------------------------------------------#
+# Shows.
+# ----------------------------------------------------------------------------#
+
+shows = Blueprint('shows', __name__, url_prefix='/shows')
+
+EXPORT_FIELDS = ['id', 'venue_id', 'venue_name', 'artist_id', 'artist_name',
+                 'artist_image_link', 'start_time', 'duration_minutes']
+
+
+@shows.route('')
+def index():
+    data = queries.show_list(request.args.get('after'))
+    return render_template('pages/shows.html', shows=data['shows'],
+                           next_cursor=data['next_cursor'])
+
+#  Create Show
+#  ----------------------------------------------------------------
+
+@shows.route('/create')
+def create_shows():
+  # renders form. do not touch.
+  form = ShowForm()
+  return render_template('forms/new_show.html', form=form)
+
+@shows.route('/create', methods=['POST'])
+def create_show_submission():
+    form = ShowForm(request.form, meta={'csrf': False})
+
+    if form.validate():
+        venue_id = form.venue_id.data
+        artist_id = form.artist_id.data
+        start_time = form.start_time.data
+        duration_minutes = form.duration_minutes.data
+
+        error = False
+        conflict = None
+        try:
+            # The exclusion constraint on venue_booking has the final say;
+            # checking first gives a useful message in the common case.
+            conflict = bookings.first_conflict(venue_id, start_time,
+                                               duration_minutes)
+            if conflict is None:
+                show = Show(venue_id=venue_id, artist_id=artist_id,
+                            start_time=start_time,
+                            duration_minutes=duration_minutes)
+                db.session.add(show)
+                db.session.commit()
+                queries.show_changed(venue_id, artist_id)
+        except:
+            print(sys.exc_info())
+            error = True
+            db.session.rollback()
+        finally:
+            db.session.close()
+
+        if conflict is not None:
+            flash('The venue is already booked from %s to %s.'
+                  % (conflict.busy_from, conflict.busy_until))
+            return render_template('forms/new_show.html', form=form)
+        if error:
+            flash('An error occurred. Show could not be listed.')
+        else:
+            flash('Show was successfully listed!')
+
+        return render_template('pages/home.html')
+    else:
+        message = []
+        for field, errors in form.errors.items():
+            for error in errors:
+                message.append(f"{field}: {error}")
+        flash('Please fix all the following errors: ' + ', '.join(message))
+        form = ShowForm()
+        return render_template('forms/new_show.html', form=form)
+
+#  Export
+#  ----------------------------------------------------------------
+
+def parse_datetime_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        abort(400)
+
+@shows.route('/export.<any(csv, ndjson):fmt>')
+def export_shows(fmt):
+    query = queries.show_query(start=parse_datetime_arg('start'),
+                               end=parse_datetime_arg('end'),
+                               venue_id=request.args.get('venue_id', type=int),
+                               artist_id=request.args.get('artist_id', type=int))\
+        .order_by(Show.start_time, Show.id)
+    return export_response(query, EXPORT_FIELDS, fmt, 'shows')
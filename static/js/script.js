@@ -2,3 +2,40 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Typeahead for ID inputs: <input data-autocomplete="artist|venue"> suggests
+// names as you type and fills in the ID of the one picked.
+document.querySelectorAll('input[data-autocomplete]').forEach(function (input) {
+  var list = document.createElement('datalist');
+  list.id = input.id + '_suggestions';
+  input.setAttribute('list', list.id);
+  input.setAttribute('autocomplete', 'off');
+  input.parentNode.appendChild(list);
+
+  var pending = null;
+  input.addEventListener('input', function () {
+    var query = input.value.trim();
+    if (!query || /^\d+$/.test(query)) {
+      return;
+    }
+    if (pending) {
+      pending.abort();
+    }
+    pending = new XMLHttpRequest();
+    pending.open('GET', '/api/v1/autocomplete?type=' + input.dataset.autocomplete +
+                 '&q=' + encodeURIComponent(query));
+    pending.onload = function () {
+      if (this.status !== 200) {
+        return;
+      }
+      list.innerHTML = '';
+      JSON.parse(this.responseText).results.forEach(function (match) {
+        var option = document.createElement('option');
+        option.value = match.id;
+        option.label = match.name;
+        list.appendChild(option);
+      });
+    };
+    pending.send();
+  });
+});
@@ -0,0 +1,92 @@
+import os
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from cache import LRUCache
+
+# ----------------------------------------------------------------------------#
+# Template caching.
+# ----------------------------------------------------------------------------#
+# Compiled templates are kept on disk in JINJA_BYTECODE_CACHE_DIR, so a new
+# worker loads bytecode instead of parsing and compiling the layout and page
+# templates again; `flask templates compile` fills the directory at deploy
+# time. Entries are keyed by template name and checked against a checksum of
+# the source, so an edited template is recompiled.
+#
+# {% cache key, ... %}...{% endcache %} keeps the rendered body in an
+# in-process LRU under the template name, the tag's line and the given key
+# parts, typically a row id and version: the tiles of a long listing are
+# rendered once, not through the datetime filter on every request. Fragments
+# are small and cheap to rebuild, so they stay in the worker rather than in
+# the configured cache backend, whose entries they would otherwise evict.
+
+
+class FragmentCacheExtension(Extension):
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super(FragmentCacheExtension, self).__init__(environment)
+        environment.extend(fragment_cache=None, fragment_cache_timeout=None)
+
+    def parse(self, parser):
+        token = next(parser.stream)
+        parts = [nodes.Const(parser.name), nodes.Const(token.lineno)]
+        while parser.stream.current.type != 'block_end':
+            if len(parts) > 2:
+                parser.stream.expect('comma')
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(parts)]),
+                               [], [], body).set_lineno(token.lineno)
+
+    def _render(self, parts, caller):
+        fragments = self.environment.fragment_cache
+        if fragments is None:
+            return caller()
+        key = ':'.join(str(part) for part in parts)
+        body = fragments.get(key)
+        if body is None:
+            body = caller()
+            fragments.set(key, body, self.environment.fragment_cache_timeout)
+        return Markup(body)
+
+
+def init_app(app):
+    directory = app.config['JINJA_BYTECODE_CACHE_DIR']
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    if app.config['FRAGMENT_CACHE_MAX_ENTRIES']:
+        app.jinja_env.fragment_cache = LRUCache(
+            max_entries=app.config['FRAGMENT_CACHE_MAX_ENTRIES'])
+        app.jinja_env.fragment_cache_timeout = \
+            app.config['FRAGMENT_CACHE_TIMEOUT']
+
+
+templates_command = AppGroup('templates', help='Manage compiled templates.')
+
+
+@templates_command.command('compile')
+def compile_command():
+    """Compile every template into the bytecode cache."""
+    if current_app.jinja_env.bytecode_cache is None:
+        raise click.ClickException('JINJA_BYTECODE_CACHE_DIR is not set')
+    click.echo('%d templates compiled' % compile_templates(current_app))
+
+
+def compile_templates(app):
+    """Load every page template, filling the bytecode cache and the
+    environment's template cache; return how many were loaded."""
+    env = app.jinja_env
+    names = [name for name in env.list_templates() if name.endswith('.html')]
+    for name in names:
+        env.get_template(name)
+    return len(names)
@@ -0,0 +1,45 @@
+from model import db, Artist, Venue
+
+
+def test_venue_etag_and_body_follow_writes_of_other_workers(app, database,
+                                                            cached):
+    venue = Venue(name='The Musical Hop', city='San Francisco', state='CA',
+                  genres=['Jazz'])
+    db.session.add(venue)
+    db.session.commit()
+    client = app.test_client()
+    first = client.get('/api/v1/venues/%d' % venue.id)
+
+    # Another worker's write: this process's cache is not invalidated.
+    db.session.execute('UPDATE "Venue" SET name = :name, updated_at = now() '
+                       'WHERE id = :id', {'name': 'The Dueling Pianos Bar',
+                                          'id': venue.id})
+    db.session.commit()
+    second = client.get('/api/v1/venues/%d' % venue.id,
+                        headers={'If-None-Match': first.headers['ETag']})
+
+    assert second.status_code == 200
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert second.get_json()['name'] == 'The Dueling Pianos Bar'
+
+
+def test_deleted_artist_leaves_the_list_despite_if_modified_since(app,
+                                                                  database,
+                                                                  cached):
+    for name in ('Guns N Petals', 'Matt Quevedo'):
+        db.session.add(Artist(name=name, genres=['Rock n Roll']))
+    db.session.commit()
+    client = app.test_client()
+    first = client.get('/api/v1/artists')
+    assert len(first.get_json()['artists']) == 2
+
+    # Deleting a row changes no timestamp of the rows left.
+    db.session.execute('DELETE FROM "Artist" WHERE name = :name',
+                       {'name': 'Matt Quevedo'})
+    db.session.commit()
+    second = client.get('/api/v1/artists', headers={
+        'If-Modified-Since': first.headers['Last-Modified']})
+
+    assert second.status_code == 200
+    assert [artist['name'] for artist in second.get_json()['artists']] == [
+        'Guns N Petals']
@@ -0,0 +1,17 @@
+import os
+
+import assets
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'static')
+
+
+def test_build_writes_gzip_and_brotli_files(tmp_path):
+    manifest, compressed = assets.build(STATIC_DIR, str(tmp_path))
+
+    css = [name for name in manifest if name.endswith('.css')]
+    assert css
+    for name in css:
+        path = os.path.join(str(tmp_path), *manifest[name].split('/'))
+        assert os.path.exists(path + '.gz')
+        assert os.path.exists(path + '.br')
@@ -0,0 +1,26 @@
+from autocomplete import autocomplete
+from model import db, Venue
+
+
+def test_rename_during_rebuild_reaches_the_new_index(app, database,
+                                                     monkeypatch):
+    venue = Venue(name='Old Hall', city='San Francisco', state='CA',
+                  genres=['Jazz'])
+    db.session.add(venue)
+    db.session.commit()
+
+    load = autocomplete.load
+
+    def load_then_rename():
+        # The rebuild has read the old name when the write is served.
+        indexes = load()
+        venue.name = 'New Hall'
+        db.session.commit()
+        autocomplete.changed('venue', venue.id)
+        return indexes
+
+    monkeypatch.setattr(autocomplete, 'load', load_then_rename)
+    autocomplete.build()
+
+    assert autocomplete.search('venue', 'hall', 10) == [
+        {'id': venue.id, 'name': 'New Hall'}]
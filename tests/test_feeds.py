@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+from conftest import recorded_statements
+from model import db, Artist, Show, Venue
+
+
+def test_feed_etag_is_the_same_for_the_same_shows(app, database, cached):
+    venue = Venue(name='The Musical Hop', city='San Francisco', state='CA',
+                  genres=['Jazz'])
+    artist = Artist(name='Guns N Petals', city='San Francisco', state='CA',
+                    genres=['Rock n Roll'])
+    db.session.add(Show(venue=venue, artist=artist,
+                        start_time=datetime.now() + timedelta(days=3)))
+    db.session.commit()
+    path = '/venues/%d/calendar.ics' % venue.id
+
+    first = app.test_client().get(path)
+    assert b'Guns N Petals at The Musical Hop' in first.data
+    # Another worker, with nothing cached, derives the same ETag and body.
+    app.extensions['cache'].clear()
+    second = app.test_client().get(path)
+    assert second.data == first.data
+    assert second.headers['ETag'] == first.headers['ETag']
+
+    polled = app.test_client().get(path, headers={
+        'If-None-Match': first.headers['ETag']})
+    assert polled.status_code == 304
+
+    artist.name = 'Guns N Roses'
+    db.session.commit()
+    changed = app.test_client().get(path, headers={
+        'If-None-Match': first.headers['ETag']})
+    assert b'Guns N Roses at The Musical Hop' in changed.data
+    assert changed.status_code == 200
+
+
+def test_area_feed_poll_reads_no_show(app, database, cached):
+    venue = Venue(name='The Musical Hop', city='San Francisco', state='CA',
+                  genres=['Jazz'])
+    artist = Artist(name='Guns N Petals', genres=['Rock n Roll'])
+    db.session.add(Show(venue=venue, artist=artist,
+                        start_time=datetime.now() + timedelta(days=3)))
+    db.session.commit()
+    venue_id, artist_id = venue.id, artist.id
+    path = '/calendar/CA/San Francisco.ics'
+    client = app.test_client()
+    first = client.get(path)
+    assert b'Guns N Petals at The Musical Hop' in first.data
+
+    with recorded_statements() as statements:
+        polled = client.get(path, headers={
+            'If-None-Match': first.headers['ETag']})
+    assert polled.status_code == 304
+    assert len(statements) == 1
+    assert '"Show"' not in statements[0][0]
+
+    # Another worker's write: this process's cache is not invalidated.
+    db.session.execute('INSERT INTO "Show" (venue_id, artist_id, start_time) '
+                       'VALUES (:venue_id, :artist_id, :start_time)',
+                       {'venue_id': venue_id, 'artist_id': artist_id,
+                        'start_time': datetime.now() + timedelta(days=4)})
+    db.session.commit()
+    changed = client.get(path, headers={
+        'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200
+    assert changed.data.count(b'BEGIN:VEVENT') == 2
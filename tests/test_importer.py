@@ -0,0 +1,88 @@
+import json
+from datetime import datetime
+
+import importer
+from importer import import_command
+from model import db, Artist, Show, Venue
+
+
+def test_import_rejects_shows_overlapping_a_booking(app, database, tmp_path):
+    venue = Venue(name='The Musical Hop', city='San Francisco', state='CA',
+                  genres=['Jazz'])
+    artist = Artist(name='Guns N Petals', genres=['Rock n Roll'])
+    db.session.add(Show(venue=venue, artist=artist,
+                        start_time=datetime(2030, 5, 1, 20, 0)))
+    db.session.commit()
+
+    shows = tmp_path / 'shows.ndjson'
+    records = [
+        ('2030-05-01 21:00:00', 60),    # overlaps the show in the database
+        ('2030-05-02 20:00:00', 120),   # kept
+        ('2030-05-02 21:30:00', 60),    # overlaps the record above
+        ('2030-05-03 20:00:00', 120),   # kept
+    ]
+    shows.write_text(''.join(json.dumps({
+        'venue_id': venue.id, 'artist_id': artist.id, 'start_time': start,
+        'duration_minutes': minutes}) + '\n' for start, minutes in records))
+    rejects = tmp_path / 'rejects.ndjson'
+
+    # The app's commands are only registered under the flask command.
+    result = app.test_cli_runner().invoke(import_command, args=[
+        'shows', str(shows), '--rejects', str(rejects)])
+
+    assert result.exit_code == 0, result.output
+    assert '4 records read, 2 loaded, 2 rejected' in result.output
+    rejected = [json.loads(line) for line in rejects.read_text().splitlines()]
+    assert [reject['record'] for reject in rejected] == [1, 3]
+    assert Show.query.count() == 3
+
+
+def test_sequence_continues_after_explicit_ids(app, database):
+    importer.reset_sequence(Artist)
+    db.session.commit()
+    first = Artist(name='Guns N Petals', genres=['Rock n Roll'])
+    db.session.add(first)
+    db.session.commit()
+    assert first.id == 1
+
+    db.session.add(Artist(id=5, name='Matt Quevedo', genres=['Jazz']))
+    db.session.commit()
+    importer.reset_sequence(Artist)
+    db.session.commit()
+    next_artist = Artist(name='The Wild Sax Band', genres=['Jazz'])
+    db.session.add(next_artist)
+    db.session.commit()
+    assert next_artist.id == 6
+
+
+def test_interrupted_import_resumes_after_the_last_chunk(app, database,
+                                                         tmp_path,
+                                                         monkeypatch):
+    artists = tmp_path / 'artists.csv'
+    artists.write_text('name,city,state,genres,facebook_link\n' + ''.join(
+        'Artist %d,San Francisco,CA,Jazz,https://www.facebook.com/artist%d\n'
+        % (number, number) for number in range(5)))
+    runner = app.test_cli_runner()
+    load = importer.load
+    calls = []
+
+    def load_twice(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise RuntimeError('interrupted')
+        load(*args)
+
+    monkeypatch.setattr(importer, 'load', load_twice)
+    result = runner.invoke(import_command, args=[
+        'artists', str(artists), '--chunk-size', '2'])
+    assert isinstance(result.exception, RuntimeError)
+    assert Artist.query.count() == 2
+
+    monkeypatch.setattr(importer, 'load', load)
+    result = runner.invoke(import_command, args=[
+        'artists', str(artists), '--chunk-size', '2'])
+    assert result.exit_code == 0, result.output
+    assert 'Resuming after 2 records' in result.output
+    assert sorted(name for name, in db.session.query(Artist.name)) == [
+        'Artist %d' % number for number in range(5)]
+    assert importer.read_checkpoint(str(artists)) == 0
@@ -0,0 +1,51 @@
+import instrumentation
+from instrumentation import Metrics, RequestStats
+
+
+def worker_state(requests, checked_out):
+    metrics = Metrics()
+    for _ in range(requests):
+        metrics.observe('venues.venues', RequestStats(), 0.01)
+    metrics.observe_checkout(0.002)
+    state = metrics.state()
+    state['pool'] = {'fyyur_db_pool_size': 5,
+                     'fyyur_db_pool_checked_out': checked_out,
+                     'fyyur_db_pool_overflow': 0}
+    return state
+
+
+def scrape(directory):
+    text = instrumentation.render_state(instrumentation.merge_states(
+        instrumentation.read_states(directory)))
+    return dict(line.rsplit(' ', 1) for line in text.splitlines()
+                if not line.startswith('#'))
+
+
+def test_metrics_add_up_the_workers_and_keep_retired_counters(tmp_path):
+    directory = str(tmp_path)
+    instrumentation.write_state(directory, '101.json', worker_state(3, 2))
+    instrumentation.write_state(directory, '102.json', worker_state(4, 1))
+
+    both = scrape(directory)
+    assert both['fyyur_request_duration_seconds_count{endpoint="venues.venues"}'] == '7'
+    assert both['fyyur_db_pool_checkout_seconds_count'] == '2'
+    assert both['fyyur_db_pool_checked_out'] == '3'
+    assert both['fyyur_metrics_processes'] == '2'
+
+    # A recycled worker's requests stay counted; its connections do not.
+    instrumentation.retire_processes(directory, {102})
+    assert not (tmp_path / '101.json').exists()
+    left = scrape(directory)
+    assert left['fyyur_request_duration_seconds_count{endpoint="venues.venues"}'] == '7'
+    assert left['fyyur_db_pool_checkout_seconds_count'] == '2'
+    assert left['fyyur_db_pool_checked_out'] == '1'
+    assert left['fyyur_metrics_processes'] == '1'
+
+
+def test_single_process_rendering_is_unchanged():
+    metrics = Metrics()
+    metrics.observe('venues.venues', RequestStats(), 0.01)
+    text = metrics.render(None)
+    assert 'fyyur_request_duration_seconds_count{endpoint="venues.venues"} 1' in text
+    assert 'fyyur_db_pool_size' not in text
+    assert 'fyyur_metrics_processes 1' in text
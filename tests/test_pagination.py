@@ -0,0 +1,37 @@
+import pytest
+
+from model import db, Artist
+from pagination import encode_cursor
+
+
+@pytest.fixture
+def small_pages(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'PAGE_SIZE', 5)
+
+
+def test_listing_walk_includes_rows_with_null_keys(app, database, small_pages):
+    names = ['Artist %02d' % number for number in range(23)] + [None, None]
+    for name in names:
+        db.session.add(Artist(name=name, genres=['Jazz']))
+    db.session.commit()
+    client = app.test_client()
+
+    seen, cursor = [], None
+    while True:
+        response = client.get('/api/v1/artists',
+                              query_string={'after': cursor} if cursor else {})
+        assert response.status_code == 200
+        page = response.get_json()
+        seen.extend(artist['name'] for artist in page['artists'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert seen == [None, None] + names[:23]
+
+
+@pytest.mark.parametrize('values', [[{'x': 1}, 1], [['a'], 1], ['a', [1]]])
+def test_cursor_of_unexpected_values_is_a_bad_request(app, database, values):
+    response = app.test_client().get('/api/v1/artists', query_string={
+        'after': encode_cursor(values)})
+    assert response.status_code == 400
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import queries
+from conftest import recorded_statements
+from model import db, Artist, Show, Venue
+
+# The venue and artist pages must reach their shows through the
+# (venue_id, start_time) and (artist_id, start_time) indexes in each
+# partition of "Show" holding them. The tables are too small for the planner to prefer
+# them on its own, so sequential scans are disabled for the EXPLAIN: a plan
+# still scanning "Show" sequentially would mean no index can serve it.
+
+
+def index_names(columns):
+    # Indexes of "Show" and its partitions ending with these columns.
+    rows = db.session.execute(
+        "SELECT indexname FROM pg_indexes "
+        "WHERE tablename LIKE 'Show%' AND indexdef LIKE :definition",
+        {'definition': '%%(%s)' % columns})
+    return {row.indexname for row in rows}
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+def explain(statement, parameters):
+    with db.engine.begin() as connection:
+        connection.execute('SET LOCAL enable_seqscan = off')
+        plan = connection.execute('EXPLAIN (FORMAT JSON) ' + statement,
+                                  parameters).scalar()
+    return list(plan_nodes(plan[0]['Plan']))
+
+
+@pytest.fixture
+def shows(database):
+    # The page's venue and artist share four shows among many others, so
+    # that filtering on them is selective.
+    now = datetime.now()
+    venues = [Venue(name='Venue %d' % number, city='San Francisco', state='CA',
+                    genres=['Jazz']) for number in range(20)]
+    artists = [Artist(name='Artist %d' % number, city='San Francisco',
+                      state='CA', genres=['Jazz']) for number in range(20)]
+    for number in range(400):
+        db.session.add(Show(venue=venues[number % 20],
+                            artist=artists[number // 20],
+                            start_time=now + timedelta(days=number % 90 - 45,
+                                                       hours=number // 20)))
+    db.session.commit()
+    db.session.execute('ANALYZE')
+    return venues[0].id, artists[0].id
+
+
+@pytest.mark.parametrize('page, columns', [
+    ('venue', 'venue_id, start_time'),
+    ('artist', 'artist_id, start_time'),
+])
+def test_detail_rows_use_show_indexes(shows, page, columns):
+    venue_id, artist_id = shows
+    if page == 'venue':
+        arguments = (Venue, venue_id, Show.venue_id, Artist, Show.artist_id,
+                     [Artist.name])
+    else:
+        arguments = (Artist, artist_id, Show.artist_id, Venue, Show.venue_id,
+                     [Venue.name])
+    with recorded_statements() as statements:
+        rows = queries.detail_rows(*arguments, past_limit=30)
+    assert len(rows) == 20
+
+    # Empty partitions are left out: any index serves them equally well.
+    partitions = {row[0] for row in db.session.execute(
+        'SELECT DISTINCT tableoid::regclass::text FROM "Show"')}
+    scans = [node for node in explain(*statements[-1])
+             if '"%s"' % node.get('Relation Name') in partitions]
+    assert scans
+    for scan in scans:
+        assert scan['Node Type'] != 'Seq Scan'
+        used = {node.get('Index Name') for node in plan_nodes(scan)} - {None}
+        assert used and used <= index_names(columns)
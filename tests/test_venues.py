@@ -0,0 +1,150 @@
+import time
+from datetime import datetime, timedelta
+
+import area_summary
+import queries
+from autocomplete import autocomplete
+from cache import cache
+from conftest import recorded_statements
+from model import db, Artist, Show, Venue
+
+
+def add_venues(count):
+    artist = Artist(name='The Wild Sax Band', city='San Francisco', state='CA',
+                    genres=['Jazz'])
+    db.session.add(artist)
+    starts = datetime.now() + timedelta(days=7)
+    for number in range(count):
+        venue = Venue(name='Venue %d' % number, city='City %d' % (number % 3),
+                      state='CA', genres=['Jazz'])
+        db.session.add(venue)
+        db.session.flush()
+        db.session.add(Show(venue=venue, artist=artist,
+                            start_time=starts + timedelta(hours=number)))
+    db.session.commit()
+    area_summary.refresh()
+
+
+def venues_statements(client):
+    with recorded_statements() as statements:
+        response = client.get('/venues')
+    assert response.status_code == 200
+    return len(statements)
+
+
+def test_venues_statement_count_does_not_grow_with_venues(app, database):
+    client = app.test_client()
+    # The first request of the app also starts its background work.
+    client.get('/venues')
+
+    add_venues(1)
+    one = venues_statements(client)
+    add_venues(40)
+    many = venues_statements(client)
+
+    assert one == many
+    assert b'Venue 39' in client.get('/venues').data
+
+
+def test_venue_page_follows_writes_of_other_workers(app, database, cached):
+    venue = Venue(name='The Musical Hop', city='San Francisco', state='CA',
+                  genres=['Jazz'])
+    db.session.add(venue)
+    db.session.commit()
+    client = app.test_client()
+    assert b'The Musical Hop' in client.get('/venues/%d' % venue.id).data
+
+    # Another worker's write: this process's cache is not invalidated.
+    db.session.execute('UPDATE "Venue" SET name = :name, updated_at = now() '
+                       'WHERE id = :id', {'name': 'The Dueling Pianos Bar',
+                                          'id': venue.id})
+    db.session.commit()
+    assert b'The Dueling Pianos Bar' in client.get('/venues/%d' % venue.id).data
+
+
+def test_failed_invalidation_does_not_fail_the_committed_edit(app, database,
+                                                              monkeypatch):
+    venue = Venue(name='The Musical Hop', city='San Francisco', state='CA',
+                  genres=['Jazz'])
+    db.session.add(venue)
+    db.session.commit()
+    venue_id = venue.id
+
+    def fail(kind, id):
+        raise RuntimeError('index unavailable')
+    monkeypatch.setattr(autocomplete, 'changed', fail)
+    response = app.test_client().post('/venues/%d/edit' % venue_id, data={
+        'name': 'The Dueling Pianos Bar', 'city': 'New York', 'state': 'NY',
+        'genres': 'Jazz'})
+
+    assert response.status_code == 302
+    assert db.session.query(Venue.name).filter(Venue.id == venue_id)\
+        .scalar() == 'The Dueling Pianos Bar'
+
+
+def test_deleted_venue_invalidates_its_area(app, database, monkeypatch):
+    venue = Venue(name='The Musical Hop', city='San Francisco', state='CA',
+                  genres=['Jazz'])
+    db.session.add(venue)
+    db.session.commit()
+    venue_id = venue.id
+
+    invalidated = []
+    monkeypatch.setattr(cache, 'invalidate',
+                        lambda *namespaces: invalidated.extend(namespaces))
+    response = app.test_client().delete('/venues/%d' % venue_id)
+
+    assert response.status_code == 200
+    assert queries.area_namespace('San Francisco', 'CA') in invalidated
+    assert 'venue:%d' % venue_id in invalidated
+
+
+def test_venue_page_follows_shows_and_artists_of_other_workers(app, database,
+                                                               cached):
+    artist = Artist(name='Guns N Petals', genres=['Rock n Roll'])
+    venue = Venue(name='The Musical Hop', city='San Francisco', state='CA',
+                  genres=['Jazz'])
+    db.session.add_all([artist, venue])
+    db.session.commit()
+    artist_id, venue_id = artist.id, venue.id
+    client = app.test_client()
+    url = '/api/v1/venues/%d' % venue_id
+    client.get(url)
+
+    # Other workers' writes, to the shows and to an artist of the venue.
+    db.session.execute('INSERT INTO "Show" (venue_id, artist_id, start_time) '
+                       'VALUES (:venue_id, :artist_id, :start_time)', {
+                           'venue_id': venue_id, 'artist_id': artist_id,
+                           'start_time': datetime.now() + timedelta(days=7)})
+    db.session.commit()
+    shows = client.get(url).get_json()['upcoming_shows']
+    assert [show['artist_name'] for show in shows] == ['Guns N Petals']
+    db.session.execute('UPDATE "Artist" SET name = :name WHERE id = :id',
+                       {'name': 'Matt Quevedo', 'id': artist_id})
+    db.session.commit()
+    shows = client.get(url).get_json()['upcoming_shows']
+    assert [show['artist_name'] for show in shows] == ['Matt Quevedo']
+
+
+def test_cached_venue_page_costs_one_lookup(app, database, cached):
+    add_venues(1)
+    venue_id = db.session.query(Venue.id).scalar()
+    client = app.test_client()
+    client.get('/api/v1/venues/%d' % venue_id)
+
+    with recorded_statements() as statements:
+        assert client.get('/api/v1/venues/%d' % venue_id).status_code == 200
+    assert len(statements) == 1
+    assert 'count(' not in statements[0][0]
+
+
+def test_venue_version_changes_when_a_show_starts(app, database):
+    add_venues(1)
+    venue_id = db.session.query(Venue.id).scalar()
+    db.session.execute('UPDATE "Show" SET start_time = now() + interval '
+                       "'1 second'")
+    db.session.commit()
+    before = queries.venue_version(venue_id)
+    time.sleep(1.1)
+    db.session.commit()
+    assert queries.venue_version(venue_id) != before
@@ -0,0 +1,198 @@
+import sys
+
+from flask import (Blueprint, abort, current_app, flash, redirect,
+                   render_template, request, url_for)
+
+import queries
+import search
+from export import export_response
+from forms import VenueForm
+from model import db, Venue
+from recommendations import recommender
+from replicas import read_only, use_primary
+
+# ----------------------------------------------------------------------------#
+# Venues.
+# ----------------------------------------------------------------------------#
+
+venues = Blueprint('venues', __name__, url_prefix='/venues')
+
+EXPORT_FIELDS = ['id', 'name', 'city', 'state', 'address', 'phone', 'genres',
+                 'image_link', 'facebook_link', 'website_link',
+                 'seeking_talent', 'seeking_description']
+
+
+@venues.route('')
+def index():
+    data = queries.venue_areas(request.args.get('after'))
+    return render_template('pages/venues.html', areas=data['areas'],
+                           next_cursor=data['next_cursor'])
+
+@venues.route('/search', methods=['POST'])
+@read_only
+def search_venues():
+    search_text = request.form['search_term']
+    venues = search.search_venues(search_text)
+
+    data = []
+    for venue in venues:
+        data.append({
+            'id': venue.id,
+            'name': venue.name,
+            'num_upcoming_shows': venue.num_upcoming_shows
+        })
+
+    response = {
+        "count": len(venues),
+        "data": data
+    }
+    return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+
+@venues.route('/<int:venue_id>')
+def show_venue(venue_id):
+    data = queries.venue_detail(venue_id,
+                                past_before=request.args.get('past_before'))
+    if not data:
+        abort(404)
+    recommendations = recommender.recommend(
+        'venue', data, current_app.config['RECOMMENDATIONS_LIMIT'])
+    return render_template('pages/show_venue.html', venue=data,
+                           recommendations=recommendations)
+
+#  Create Venue
+#  ----------------------------------------------------------------
+
+@venues.route('/create', methods=['GET'])
+def create_venue_form():
+  form = VenueForm()
+  return render_template('forms/new_venue.html', form=form)
+
+@venues.route('/create', methods=['POST'])
+def create_venue_submission():
+    # Set the FlaskForm
+    form = VenueForm(request.form, meta={'csrf': False})
+
+    # Validate all fields
+    if form.validate():
+        error = False
+        try:
+            venue = Venue(name=form.name.data,
+                          city=form.city.data,
+                          state=form.state.data,
+                          address=form.address.data,
+                          phone=form.phone.data,
+                          genres=form.genres.data,
+                          facebook_link=form.facebook_link.data,
+                          image_link=form.image_link.data,
+                          website_link=form.website_link.data,
+                          seeking_talent=form.seeking_talent.data,
+                          seeking_description=form.seeking_description.data
+            )
+            db.session.add(venue)
+            db.session.commit()
+            queries.venue_changed(venue.id)
+        except:
+            print(sys.exc_info())
+            error = True
+            db.session.rollback()
+        finally:
+            db.session.close()
+
+        if error:
+            flash('An error occurred. Venue ' +
+                form.name.data + ' could not be listed.')
+        else:
+            flash('Venue ' + form.name.data + ' was successfully listed!')
+
+        return render_template('pages/home.html')
+    # If there is any invalid field
+    else:
+        message = []
+        for field, errors in form.errors.items():
+            for error in errors:
+                message.append(f"{field}: {error}")
+        flash('Please fix the following errors: ' + ', '.join(message))
+        form = VenueForm()
+        return render_template('forms/new_venue.html', form=form)
+
+@venues.route('/<venue_id>', methods=['DELETE'])
+def delete_venue(venue_id):
+    venue = Venue.query.get(venue_id)
+    if not venue:
+        abort(404)
+
+    error = False
+    previous_area = (venue.city, venue.state)
+    try:
+        artist_ids = queries.venue_artist_ids(venue_id)
+        db.session.delete(venue)
+        db.session.commit()
+        queries.venue_changed(venue_id, previous_area, artist_ids)
+    except:
+        print(sys.exc_info())
+        error = True
+        db.session.rollback()
+    finally:
+        db.session.close()
+
+    if error:
+        abort(500)
+    return render_template('pages/home.html')
+
+#  Update
+#  ----------------------------------------------------------------
+
+@venues.route('/<int:venue_id>/edit', methods=['GET'])
+@use_primary
+def edit_venue(venue_id):
+    venue = Venue.query.get(venue_id)
+    if not venue:
+        abort(404)
+    form = VenueForm(obj=venue)
+    return render_template('forms/edit_venue.html', form=form, venue=venue)
+
+@venues.route('/<int:venue_id>/edit', methods=['POST'])
+def edit_venue_submission(venue_id):
+    venue = Venue.query.get(venue_id)
+    if not venue:
+        abort(404)
+
+    form = VenueForm(request.form, meta={'csrf': False})
+    error = False
+    previous_area = (venue.city, venue.state)
+
+    try:
+        venue.name = form.name.data
+        venue.city = form.city.data
+        venue.state = form.state.data
+        venue.image_link = form.image_link.data
+        venue.facebook_link = form.facebook_link.data
+        venue.genres = form.genres.data
+        venue.website_link = form.website_link.data
+        venue.address = form.address.data
+        venue.phone = form.phone.data
+        venue.seeking_description = form.seeking_description.data
+        venue.seeking_talent = form.seeking_talent.data
+        db.session.commit()
+        queries.venue_changed(venue_id, previous_area)
+    except:
+        error = True
+        print(sys.exc_info())
+        db.session.rollback()
+    finally:
+        db.session.close()
+
+    if error:
+        abort(500)
+
+    return redirect(url_for('venues.show_venue', venue_id=venue_id))
+
+#  Export
+#  ----------------------------------------------------------------
+
+@venues.route('/export.<any(csv, ndjson):fmt>')
+def export_venues(fmt):
+    query = Venue.query.with_entities(
+        *[getattr(Venue, field) for field in EXPORT_FIELDS])\
+        .order_by(Venue.id)
+    return export_response(query, EXPORT_FIELDS, fmt, 'venues')
@@ -0,0 +1,4 @@
+from app import create_app
+
+# Entry point for WSGI servers: gunicorn wsgi:app
+app = create_app()